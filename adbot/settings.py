@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'apps.reports',
     'apps.push',
     'apps.tel_tools',
+    'apps.utils',
 
     'markdownx',
     'rest_framework',
@@ -156,6 +157,31 @@ SEND_SHOT_START_HOUR = config('SEND_SHOT_START_HOUR', cast=int)
 SEND_SHOT_END_HOUR = config('SEND_SHOT_END_HOUR', cast=int)
 
 EXPIRE_PUSH_MINUTE = config('EXPIRE_PUSH_MINUTE', default=30, cast=int)
+EXPIRE_PUSH_BATCH_SIZE = config('EXPIRE_PUSH_BATCH_SIZE', default=200, cast=int)
+# reconciliation sweep only rescans pushes created in this window
+EXPIRE_PUSH_SWEEP_MINUTE = config('EXPIRE_PUSH_SWEEP_MINUTE', default=24 * 60, cast=int)
+PUSH_DATA_CACHE_TIMEOUT = config('PUSH_DATA_CACHE_TIMEOUT', default=4 * 60 * 60, cast=int)
+
+# short link hits are coalesced in cache per time bucket then flushed as ShortLinkLog
+SHORT_LINK_BUFFER_SECONDS = config('SHORT_LINK_BUFFER_SECONDS', default=60, cast=int)
+# short link logs younger than this are not compacted, must be longer than hit buffer pending buckets (10 buckets)
+SHORT_LINK_LOGS_COMPACT_LAG_MINUTE = config('SHORT_LINK_LOGS_COMPACT_LAG_MINUTE', default=15, cast=int)
+# short link redirects: in process LRU in front of shared cache
+SHORT_LINK_CACHE_TIMEOUT = config('SHORT_LINK_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+SHORT_LINK_LOCAL_CACHE_SIZE = config('SHORT_LINK_LOCAL_CACHE_SIZE', default=10000, cast=int)
+SHORT_LINK_LOCAL_CACHE_TIMEOUT = config('SHORT_LINK_LOCAL_CACHE_TIMEOUT', default=30, cast=int)
+
+CAMPAIGN_REPORT_CACHE_TIMEOUT = config('CAMPAIGN_REPORT_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+# advertiser report snapshots, rendered on new views (debounced by delay) and by age
+CAMPAIGN_REPORT_SNAPSHOT_DELAY = config('CAMPAIGN_REPORT_SNAPSHOT_DELAY', default=30, cast=int)
+CAMPAIGN_REPORT_SNAPSHOT_MAX_AGE = config('CAMPAIGN_REPORT_SNAPSHOT_MAX_AGE', default=10 * 60, cast=int)
+CAMPAIGN_REPORT_SNAPSHOT_LOCK_TIMEOUT = config('CAMPAIGN_REPORT_SNAPSHOT_LOCK_TIMEOUT', default=30, cast=int)
+
+# choose publishers for campaign push: greedy, sorted_prefix, knapsack
+PUSH_CHANNEL_ALLOCATOR = config('PUSH_CHANNEL_ALLOCATOR', default='sorted_prefix')
+
+# concurrent push sending workers per task
+PUSH_FANOUT_WORKERS = config('PUSH_FANOUT_WORKERS', default=8, cast=int)
 
 celery_app.conf.beat_schedule = {
     'process_campaign_tasks': {
@@ -170,10 +196,30 @@ celery_app.conf.beat_schedule = {
         'task': 'apps.push.tasks.check_expire_campaign_push',
         'schedule': crontab(**SEND_PUSH_SCHEDULE),
     },
+    'fire_expired_push': {
+        'task': 'apps.push.tasks.fire_expired_campaign_pushes',
+        'schedule': crontab(),
+    },
     'send_shot_push': {
         'task': 'apps.push.tasks.check_send_shot_push',
         'schedule': crontab(**EXPIRE_PUSH_SCHEDULE),
     },
+    'reconcile_view_counters': {
+        'task': 'apps.telegram_adv.tasks.reconcile_campaign_view_counters',
+        'schedule': crontab(minute='*/5'),
+    },
+    'refresh_campaigns_report_snapshots': {
+        'task': 'apps.telegram_adv.tasks.refresh_campaigns_report_snapshots',
+        'schedule': crontab(minute='*/5'),
+    },
+    'flush_short_link_hit_buffer': {
+        'task': 'apps.telegram_adv.tasks.flush_short_link_hit_buffer',
+        'schedule': crontab(),
+    },
+    'compact_short_link_logs': {
+        'task': 'apps.telegram_adv.tasks.compact_short_link_logs_task',
+        'schedule': crontab(minute='*/10'),
+    },
     'remove_test_campaigns': {
         'task': 'apps.telegram_adv.tasks.remove_test_campaigns_all_data',
         'schedule': crontab(**REMOVE_TEST_CAMPAIGNS),
@@ -188,9 +234,16 @@ TELEGRAM_BOT = {
     'TOKEN': config('TELEGRAM_BOT_TOKEN'),
     'MODE': config('TELEGRAM_BOT_MODE', default='POLLING'),
     'WEBHOOK_SITE': config('TELEGRAM_BOT_WEBHOOK_SITE', default=''),
-    'PROXY': f"http://{PROXY4TELEGRAM_HOST}:{PROXY4TELEGRAM_PORT}" if PROXY4TELEGRAM_HOST else ''
+    'PROXY': f"http://{PROXY4TELEGRAM_HOST}:{PROXY4TELEGRAM_PORT}" if PROXY4TELEGRAM_HOST else '',
+    'API_URL': config('TELEGRAM_BOT_API_URL', default='https://api.telegram.org/bot'),
 }
 
+# bot gateway, telegram allows ~30 messages per second per bot and 1 message per second to a chat
+# rate limits are shared by all workers through default cache
+TELEGRAM_CON_POOL_SIZE = config('TELEGRAM_CON_POOL_SIZE', default=8, cast=int)
+TELEGRAM_GLOBAL_RATE = config('TELEGRAM_GLOBAL_RATE', default=30, cast=int)
+TELEGRAM_CHAT_INTERVAL = config('TELEGRAM_CHAT_INTERVAL', default=1, cast=float)
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 LANGUAGE_CODE = 'fa'
@@ -21,8 +21,12 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from apps.telegram_adv.views import short_link_redirect, advertiser_report
+
 urlpatterns = [
     path('api/v1/', include('urls_api')),
+    path('l/<str:code>/', short_link_redirect, name='short-link-redirect'),
+    path('report/<str:encoded>/', advertiser_report, name='advertiser-report'),
     path('docs/', include_docs_urls(title='Admood API document')),
 ]
 
@@ -3,7 +3,8 @@ from django.urls import path
 from django.shortcuts import redirect, render
 
 from apps.push.models import CampaignPush, CampaignPushUser
-from apps.utils.admin import ReadOnlyAdmin, CampaignFilter, ReadOnlyTabularInline
+from apps.telegram_adv.models import CampaignUser
+from apps.utils.admin import ReadOnlyAdmin, CampaignFilter, ReadOnlyTabularInline, AnnotatedChangeListMixin
 
 
 def push_text_admin_submit(request, push_id):
@@ -40,20 +41,44 @@ class PushUserInline(ReadOnlyTabularInline):
 
 
 @admin.register(CampaignPush)
-class PushCampaignAdmin(ReadOnlyAdmin):
+class PushCampaignAdmin(AnnotatedChangeListMixin, ReadOnlyAdmin):
     list_display = ('campaign', 'status', 'channels', 'confirmed_channels')
     list_select_related = ('campaign',)
+    list_prefetch_related = ('publishers',)
     filter_horizontal = ('publishers',)
     inlines = (PushUserInline,)
     list_filter = [
         ('campaign', CampaignFilter)
     ]
 
+    def load_page(self, request, objects):
+        """
+            confirmed channels of page pushes with one query over channels of their campaigns users,
+            same as CampaignPush.confirmed_channels() tags, only channels that publish the push
+        """
+        campaigns_channels = {}
+        for campaign_id, channel_id, tag in CampaignUser.channels.through.objects.filter(
+            campaignuser__campaign_id__in={obj.campaign_id for obj in objects}
+        ).order_by(
+            'campaignuser_id', 'telegramchannel_id'
+        ).values_list(
+            'campaignuser__campaign_id', 'telegramchannel_id', 'telegramchannel__tag'
+        ):
+            campaigns_channels.setdefault(campaign_id, []).append((channel_id, tag))
+
+        for obj in objects:
+            publishers_ids = {publisher.id for publisher in obj.publishers.all()}
+            tags = {}
+            for channel_id, tag in campaigns_channels.get(obj.campaign_id, []):
+                if channel_id in publishers_ids:
+                    tags[tag] = None
+            obj._confirmed_channels = list(tags)
+
     def channels(self, obj):
-        return ", ".join(obj.publishers.values_list('tag', flat=True))
+        return ", ".join(publisher.tag for publisher in obj.publishers.all())
 
     def confirmed_channels(self, obj):
-        return ", ".join(obj.confirmed_channels().values_list('channels__tag', flat=True)) or "-"
+        return ", ".join(obj._confirmed_channels) or "-"
 
     def is_delivered(self, obj):
         return obj.is_delivered()
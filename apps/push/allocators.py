@@ -0,0 +1,139 @@
+import numpy as np
+
+from django.conf import settings
+
+KNAPSACK_MAX_ITEMS = 2000
+KNAPSACK_RESOLUTION = 4096
+
+
+def _as_array(values):
+    return np.asarray(values, dtype=np.int64)
+
+
+def greedy_allocator(view_efficiency, tariff, remain_views):
+    """
+        legacy allocation, walk channels in given order and skip every channel
+        which overshoot remain views
+
+    :param view_efficiency: channels view efficiency
+    :param tariff: channels tariff
+    :param remain_views: campaign remain views
+    :return: selected channels indexes
+    """
+    selected = []
+    sum_view_efficiency = 0
+    for index, views in enumerate(view_efficiency):
+        if sum_view_efficiency + views > remain_views:
+            continue
+
+        sum_view_efficiency += views
+        selected.append(index)
+
+    return np.asarray(selected, dtype=np.int64)
+
+
+def _fill_gap(views, selected, left, max_passes):
+    """
+        select channels which still fit left views in given order, every pass is a vectorized cumsum,
+        first candidate of a pass fits by itself so every pass selects at least one channel
+    """
+    for _ in range(max_passes):
+        candidates = np.flatnonzero(~selected & (views <= left))
+        if not candidates.size:
+            break
+
+        take = candidates[np.cumsum(views[candidates]) <= left]
+        selected[take] = True
+        left -= int(views[take].sum())
+
+    return selected
+
+
+def sorted_prefix_allocator(view_efficiency, tariff, remain_views, max_passes=32):
+    """
+        sort channels by view efficiency (cheaper tariff first on equal views) and take the
+        longest prefix which fits remain views, then fill the gap with next passes over channels
+        which still fit
+
+    :param view_efficiency: channels view efficiency
+    :param tariff: channels tariff
+    :param remain_views: campaign remain views
+    :param max_passes: max number of gap filling passes
+    :return: selected channels indexes
+    """
+    view_efficiency = _as_array(view_efficiency)
+    tariff = _as_array(tariff)
+
+    order = np.lexsort((tariff, -view_efficiency))
+    selected = _fill_gap(view_efficiency[order], np.zeros(order.size, dtype=bool), remain_views, max_passes)
+    return np.sort(order[selected])
+
+
+def knapsack_allocator(view_efficiency, tariff, remain_views):
+    """
+        0/1 knapsack on views, maximize allocated views without passing remain views.
+        views are quantized up to KNAPSACK_RESOLUTION units so quantized solution never overshoot,
+        reachable sums are kept as python int bitsets and the quantization gap is filled like sorted prefix,
+        sorted prefix or greedy selection is returned when it allocates more views.
+        campaigns with more than KNAPSACK_MAX_ITEMS candidates fall back to sorted prefix allocator
+
+    :param view_efficiency: channels view efficiency
+    :param tariff: channels tariff
+    :param remain_views: campaign remain views
+    :return: selected channels indexes
+    """
+    view_efficiency = _as_array(view_efficiency)
+    remain_views = int(remain_views)
+    candidates = np.flatnonzero(view_efficiency <= remain_views)
+    if candidates.size > KNAPSACK_MAX_ITEMS:
+        return sorted_prefix_allocator(view_efficiency, tariff, remain_views)
+
+    if not candidates.size or remain_views <= 0:
+        return np.asarray([], dtype=np.int64)
+
+    unit = -(-remain_views // KNAPSACK_RESOLUTION)
+    capacity = remain_views // unit
+    weights = -(-view_efficiency[candidates] // unit)
+    mask = (1 << (capacity + 1)) - 1
+
+    reaches = [1]
+    for weight in weights.tolist():
+        reach = reaches[-1]
+        reaches.append((reach | (reach << weight)) & mask)
+
+    best = reaches[-1].bit_length() - 1
+    selected = np.zeros(view_efficiency.size, dtype=bool)
+    for i in range(len(weights) - 1, -1, -1):
+        if not (reaches[i] >> best) & 1:
+            selected[candidates[i]] = True
+            best -= int(weights[i])
+
+    left = remain_views - int(view_efficiency[selected].sum())
+    knapsack = np.flatnonzero(_fill_gap(view_efficiency, selected, left, max_passes=32))
+
+    # quantization may lose views, never allocate less than sorted prefix or legacy greedy
+    return max(
+        (
+            knapsack,
+            sorted_prefix_allocator(view_efficiency, tariff, remain_views),
+            greedy_allocator(view_efficiency, tariff, remain_views),
+        ),
+        key=lambda selected: int(view_efficiency[selected].sum())
+    )
+
+
+ALLOCATORS = {
+    'greedy': greedy_allocator,
+    'sorted_prefix': sorted_prefix_allocator,
+    'knapsack': knapsack_allocator,
+}
+
+
+def get_allocator(name=None):
+    """
+        return channel allocator function by name, default is settings.PUSH_CHANNEL_ALLOCATOR
+
+    :param name:
+    :return:
+    """
+    return ALLOCATORS[name or settings.PUSH_CHANNEL_ALLOCATOR]
@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+from django.utils import timezone
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from apps.telegram_adv.models import Campaign
+from apps.telegram_adv.counters import reached_max_view_campaigns
+from apps.push.models import CampaignPush
+
+CampaignBudget = namedtuple(
+    'CampaignBudget',
+    ['campaign_id', 'max_view', 'confirmed_views', 'push_views', 'remain_views']
+)
+
+
+def get_campaigns_budget(campaign_ids=None):
+    """
+        compute views budget of all live campaigns with two grouped queries
+
+            * confirmed_views: sum of campaign users channels view_efficiency
+            * push_views: sum of sent (no reaction yet) pushes publishers view_efficiency,
+              they count as confirmed until user reject or push expire
+            * remain_views: max_view - (confirmed_views + push_views)
+            * campaigns which real time views counters reached max_view are skipped
+
+    :param campaign_ids: optional, limit budget computation to these campaigns
+    :return: list of CampaignBudget which has remain views
+    """
+    now = timezone.now()
+    campaigns = Campaign.objects.filter(
+        status=Campaign.STATUS_APPROVED,
+        is_enable=True,
+        start_datetime__lte=now,
+        end_datetime__gte=now,
+        file__isnull=False
+    )
+    if campaign_ids is not None:
+        campaigns = campaigns.filter(id__in=campaign_ids)
+
+    campaigns_views = list(
+        campaigns.order_by().values(
+            'id', 'max_view'
+        ).annotate(
+            confirmed_views=Coalesce(Sum('campaignuser__channels__view_efficiency'), 0)
+        )
+    )
+    # campaigns which real views already reached max_view, disable task is on the way
+    reached_campaigns_ids = reached_max_view_campaigns([c['id'] for c in campaigns_views])
+    campaigns_views = [c for c in campaigns_views if c['id'] not in reached_campaigns_ids]
+    if not campaigns_views:
+        return []
+
+    push_views = dict(
+        CampaignPush.objects.filter(
+            campaign_id__in=[c['id'] for c in campaigns_views],
+            status=CampaignPush.STATUS_SENT,
+        ).order_by().values(
+            'campaign_id'
+        ).annotate(
+            views=Coalesce(Sum('publishers__view_efficiency'), 0)
+        ).values_list('campaign_id', 'views')
+    )
+
+    budgets = []
+    for campaign in campaigns_views:
+        void_push_views = push_views.get(campaign['id'], 0)
+        remain_views = campaign['max_view'] - campaign['confirmed_views'] - void_push_views
+        if remain_views > 0:
+            budgets.append(CampaignBudget(
+                campaign_id=campaign['id'],
+                max_view=campaign['max_view'],
+                confirmed_views=campaign['confirmed_views'],
+                push_views=void_push_views,
+                remain_views=remain_views
+            ))
+
+    return budgets
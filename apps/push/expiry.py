@@ -0,0 +1,75 @@
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+WHEEL_CURSOR_KEY = 'push_expire_cursor'
+WHEEL_LOCK_KEY = 'push_expire_lock'
+WHEEL_SLOT_SECONDS = 60
+
+
+def _slot_timeout():
+    return 4 * settings.EXPIRE_PUSH_MINUTE * 60
+
+
+def _slot_key(slot, index=None):
+    if index is None:
+        return f'push_expire_{slot}'
+    return f'push_expire_{slot}_{index}'
+
+
+def register_push_deadlines(campaign_pushes):
+    """
+        register expire deadline of created pushes in a per minute timer wheel kept in cache,
+        every wheel slot has a counter and one key per push so registration is atomic without locks
+
+    :param campaign_pushes: created CampaignPush objects
+    :return:
+    """
+    timeout = _slot_timeout()
+    for campaign_push in campaign_pushes:
+        deadline = campaign_push.created_time.timestamp() + settings.EXPIRE_PUSH_MINUTE * 60
+        slot = int(deadline // WHEEL_SLOT_SECONDS)
+        cache.add(_slot_key(slot), 0, timeout)
+        try:
+            index = cache.incr(_slot_key(slot))
+        except ValueError:  # slot evicted or cache is down, reconciliation sweep expires the push
+            logger.warning(f"register push: {campaign_push.id} expire deadline failed")
+            continue
+        cache.set(_slot_key(slot, index), campaign_push.id, timeout)
+
+
+def pop_due_pushes(now=None):
+    """
+        pop pushes of all wheel slots which are passed since last call, current slot is popped
+        by the next call when all of it's deadlines are passed
+
+    :param now: timestamp, default is current time
+    :return: list of CampaignPush ids, empty if another call is popping
+    """
+    if not cache.add(WHEEL_LOCK_KEY, 1, WHEEL_SLOT_SECONDS):
+        return []
+
+    try:
+        current_slot = int((now or time.time()) // WHEEL_SLOT_SECONDS)
+        cursor = cache.get(WHEEL_CURSOR_KEY)
+        if cursor is None:
+            cursor = current_slot - _slot_timeout() // WHEEL_SLOT_SECONDS
+
+        campaign_pushes_ids = []
+        for slot in range(cursor, current_slot):
+            count = cache.get(_slot_key(slot))
+            if not count:
+                continue
+
+            keys = [_slot_key(slot, index) for index in range(1, count + 1)]
+            campaign_pushes_ids.extend(cache.get_many(keys).values())
+            cache.delete_many(keys + [_slot_key(slot)])
+
+        cache.set(WHEEL_CURSOR_KEY, current_slot, None)
+    finally:
+        cache.delete(WHEEL_LOCK_KEY)
+    return campaign_pushes_ids
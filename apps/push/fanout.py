@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+def fan_out(func, items, max_workers=None):
+    """
+        call func(item) for all items (chat ids, messages, ..) concurrently with a bounded thread pool,
+        telegram rate limits are respected by bot gateway (see apps.utils.telegram_gateway)
+
+    :param func: function which get an item and call telegram
+    :param items:
+    :param max_workers: default is settings.PUSH_FANOUT_WORKERS
+    :return: list of (item, result, error) in items order
+    """
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    items = list(items)
+    if not items:
+        return []
+
+    workers = min(max_workers or settings.PUSH_FANOUT_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, items))
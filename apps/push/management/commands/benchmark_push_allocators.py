@@ -0,0 +1,39 @@
+import timeit
+
+import numpy as np
+
+from django.core.management import BaseCommand
+
+from apps.push.allocators import ALLOCATORS
+
+
+class Command(BaseCommand):
+    help = 'Benchmark push channel allocators on random publishers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publishers', dest='publishers', type=int, default=10000,
+                            help='number of candidate publishers')
+        parser.add_argument('--remain-views', dest='remain_views', type=int, default=1000000,
+                            help='campaign remain views')
+        parser.add_argument('--repeat', dest='repeat', type=int, default=5,
+                            help='number of runs per allocator')
+        parser.add_argument('--seed', dest='seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.RandomState(options['seed'])
+        view_efficiency = rng.randint(100, 50000, size=options['publishers'])
+        tariff = rng.randint(1000, 10000, size=options['publishers'])
+        remain_views = options['remain_views']
+
+        for name, allocate in ALLOCATORS.items():
+            selected = allocate(view_efficiency, tariff, remain_views)
+            seconds = min(timeit.repeat(
+                lambda: allocate(view_efficiency, tariff, remain_views),
+                number=1,
+                repeat=options['repeat']
+            ))
+            allocated = int(view_efficiency[selected].sum())
+            self.stdout.write(
+                f"{name:<14} {seconds * 1000:>9.2f} ms  channels: {len(selected):>6}  "
+                f"allocated: {allocated:>10}  unused: {remain_views - allocated:>8}"
+            )
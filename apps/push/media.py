@@ -0,0 +1,88 @@
+import time
+import uuid
+import hashlib
+from collections import namedtuple
+
+from django.core.cache import cache
+
+UPLOAD_LOCK_TIMEOUT = 60
+
+# token is None when caller uploads without the lock (wait deadline passed)
+Upload = namedtuple('Upload', ['key', 'token'])
+
+
+def get_content_hash(campaign_file):
+    """
+        sha1 of CampaignFile content, cached by file id and name so content is read once
+
+    :param campaign_file:
+    :return:
+    """
+    name_hash = hashlib.md5(campaign_file.file.name.encode()).hexdigest()
+    key = f'campaign_file_hash_{campaign_file.id}_{name_hash}'
+    content_hash = cache.get(key)
+    if content_hash is None:
+        sha1 = hashlib.sha1()
+        with campaign_file.file.open('rb') as f:
+            for chunk in f.chunks():
+                sha1.update(chunk)
+        content_hash = sha1.hexdigest()
+        cache.set(key, content_hash, None)
+    return content_hash
+
+
+def _file_id_key(gateway, content_hash):
+    # telegram file_id is valid only for the bot which uploaded it
+    return f'tg_file_id_{gateway.name}_{content_hash}'
+
+
+def resolve_photo(gateway, campaign_file, wait=10):
+    """
+        prefer cached telegram file_id of campaign file content for gateway bot token,
+        same content in different CampaignFile rows share one file_id
+
+            * file_id cached ---> (file_id, None)
+            * else ---> (None, upload) caller should upload campaign_file.get_file() and call
+              remember_file_id(upload, response) or release_upload(upload) on failure,
+              only one caller get upload lock at a time and others wait for its file_id,
+              after wait they upload without lock
+
+    :param gateway: BotGateway
+    :param campaign_file:
+    :param wait: seconds to wait for another upload
+    :return:
+    """
+    if not campaign_file.file:  # just has telegram_file_hash
+        return campaign_file.get_file(), None
+
+    key = _file_id_key(gateway, get_content_hash(campaign_file))
+    token = uuid.uuid4().hex
+    deadline = time.time() + wait
+    while True:
+        file_id = cache.get(key)
+        if file_id:
+            return file_id, None
+
+        if cache.add(f'{key}_upload', token, UPLOAD_LOCK_TIMEOUT):
+            return None, Upload(key, token)
+
+        if time.time() > deadline:
+            return None, Upload(key, None)
+
+        time.sleep(0.5)
+
+
+def remember_file_id(upload, response):
+    file_id = response.photo[-1].file_id
+    cache.set(upload.key, file_id, None)
+    release_upload(upload)
+    return file_id
+
+
+def release_upload(upload):
+    """
+        delete upload lock only if this caller holds it, lock of another worker is kept
+    """
+    lock_key = f'{upload.key}_upload'
+    if upload.token is not None and cache.get(lock_key) == upload.token:
+        cache.delete(lock_key)
@@ -1,7 +1,10 @@
 from django.db import models
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import ugettext_lazy as _
 
 from apps.telegram_adv.models import TelegramChannel, Campaign, CampaignUser
+from apps.utils.cache_version import get_cache_version, bump_cache_version
 
 
 class CampaignPushUser(models.Model):
@@ -30,7 +33,7 @@ class CampaignPush(models.Model):
         (STATUS_REJECTED, _('rejected')),
         (STATUS_EXPIRED, _('expired')),
     )
-    created_time = models.DateTimeField(_('created time'), auto_now_add=True)
+    created_time = models.DateTimeField(_('created time'), auto_now_add=True, db_index=True)
     updated_time = models.DateTimeField(_('updated time'), auto_now=True)
     status = models.SmallIntegerField(_('status'), choices=STATUS_TYPES, default=STATUS_SENT)
 
@@ -57,10 +60,41 @@ class CampaignPush(models.Model):
             ).values_list('id', flat=True)
         ).distinct()
 
+    @staticmethod
+    def _push_data_version_key(campaign_id):
+        return f"campaign_push_data_version_{campaign_id}"
+
+    def _push_data_key(self):
+        version = get_cache_version(self._push_data_version_key(self.campaign_id))
+        return f"campaign_push_data_{self.id}_{version}"
+
+    @classmethod
+    def invalidate_campaign_push_data(cls, campaign_id):
+        """
+            invalidate cached push data of all campaign pushes, when a CampaignUser of campaign
+            gains or loses channels
+        """
+        bump_cache_version(cls._push_data_version_key(campaign_id))
+
+    def invalidate_push_data(self):
+        cache.delete(self._push_data_key())
+
     def has_push_data(self):
-        return self.__base_remain_push_data().exists()
+        return bool(self.get_push_data())
 
     def get_push_data(self):
+        """
+            remain push data grouped by sheba number, materialized once and served from cache
+            until invalidated (see apps.push.signals)
+        """
+        key = self._push_data_key()
+        data = cache.get(key)
+        if data is None:
+            data = self._build_push_data()
+            cache.set(key, data, settings.PUSH_DATA_CACHE_TIMEOUT)
+        return data
+
+    def _build_push_data(self):
         data = {}
         for publisher in self.__base_remain_push_data():
             data.setdefault(
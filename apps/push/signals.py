@@ -1,8 +1,49 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
+from apps.telegram_adv.models import CampaignUser
+from apps.push.models import CampaignPush
+from apps.push.expiry import register_push_deadlines
+
 
 @receiver(post_save, sender=PushText)
 def base_push_post_save(sender, instance, created, **kwargs):
     if not instance.telegram_file_hash:
         upload_file.apply_async(args=[instance.id, True], countdown=1)
+
+
+@receiver(post_save, sender=CampaignPush)
+def campaign_push_register_deadline(sender, instance, created, **kwargs):
+    if created:
+        register_push_deadlines([instance])
+    else:
+        instance.invalidate_push_data()
+
+
+@receiver(m2m_changed, sender=CampaignUser.channels.through)
+def campaign_user_channels_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':  # pk_set of channel.campaignuser_set.clear() is None
+        instance._cleared_campaign_ids = set(
+            CampaignUser.objects.filter(channels=instance).values_list('campaign_id', flat=True)
+        )
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse and action == 'post_clear':
+        campaign_ids = instance.__dict__.pop('_cleared_campaign_ids', set())
+    elif reverse:  # channel.campaignuser_set changed
+        campaign_ids = set(
+            CampaignUser.objects.filter(id__in=pk_set or ()).values_list('campaign_id', flat=True)
+        )
+    else:
+        campaign_ids = {instance.campaign_id}
+
+    for campaign_id in campaign_ids:
+        CampaignPush.invalidate_campaign_push_data(campaign_id)
+
+
+@receiver(post_delete, sender=CampaignUser)
+def campaign_user_deleted(sender, instance, **kwargs):
+    CampaignPush.invalidate_campaign_push_data(instance.campaign_id)
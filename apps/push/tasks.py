@@ -1,24 +1,28 @@
 import logging
 
-from telegram import Bot
-from telegram.utils.request import Request
+import numpy as np
 from celery import shared_task
 
 from django.conf import settings
 from django.utils import timezone
-from django.core.cache import cache
-from django.db.models import Sum, Prefetch
-from django.db.models.functions import Coalesce
+from django.db import connection, transaction
+from django.db.models import Prefetch
 
-from apps.telegram_adv.models import Campaign, CampaignUser, CampaignContent
+from apps.telegram_adv.models import Campaign, CampaignUser, CampaignContent, CampaignPublisher, TelegramChannel
 from apps.push.models import CampaignPush, CampaignPushUser
+from apps.push.budget import get_campaigns_budget
+from apps.push.allocators import get_allocator
+from apps.push.fanout import fan_out
+from apps.push.expiry import register_push_deadlines, pop_due_pushes
+from apps.push.media import resolve_photo, remember_file_id, release_upload
+from apps.utils.telegram_gateway import get_gateway
+from apps.utils.member_set import CacheMemberSet
 
 logger = logging.getLogger(__name__)
 
-token = settings.TELEGRAM_BOT['TOKEN']
-proxy_url = settings.TELEGRAM_BOT['PROXY']
-request = Request(con_pool_size=4, connect_timeout=3.05, read_timeout=27, proxy_url=proxy_url)
-bot = Bot(token=token, request=request)
+SHOT_PUSH_BATCH_SIZE = 100
+
+bot = get_gateway()
 
 
 @shared_task
@@ -27,80 +31,94 @@ def check_push_campaigns():
         send push for campaigns which campaignusers channels views is less than campaign max_view
     :return:
     """
-    campaigns = Campaign.objects.prefetch_related(
-        'campaignuser_set',
-        'pushes'
-    ).filter(
-        status=Campaign.STATUS_APPROVED,
-        is_enable=True,
-        start_datetime__lte=timezone.now(),
-        end_datetime__gte=timezone.now(),
-        file__isnull=False
-    ).annotate(
-        confirmed_views=Coalesce(Sum('campaignuser__channels__view_efficiency'), 0)
-    )
-
-    for campaign in campaigns:
-        # no reaction pushes should count as confirmed until user reject or expire
-        void_push_views = campaign.pushes.filter(
-            status=CampaignPush.STATUS_SENT,
-        ).aggregate(
-            views=Coalesce(Sum('publishers__view_efficiency'), 0)
-        )['views']
-        total_counted_views = campaign.confirmed_views + void_push_views
-
-        if campaign.max_view > total_counted_views:
-            generate_campaign_push(campaign.id, campaign.max_view - total_counted_views)
+    for budget in get_campaigns_budget():
+        generate_campaign_push(budget.campaign_id, budget.remain_views)
 
 
 def generate_campaign_push(campaign_id, campaign_remain_views):
     """
         create campaign pushes for campaign due to remain views and channels which has no campaign user
-        or push status is not expired or rejected to avoid conflict
+        or push status is not expired or rejected to avoid conflict,
+        channels are chosen by settings.PUSH_CHANNEL_ALLOCATOR (see apps.push.allocators)
+
+            * channels are grouped by their admins set which read once from channel admins table
+            * pushes and their users and publishers are created by bulk inserts
 
     :param campaign_id:
     :param campaign_remain_views:
     :return:
     """
-    no_push_campaign_publishers = CampaignPublisher.objects.prefetch_related(
-        'publisher__admins',
-        'publisher__sheba'
-    ).filter(
-        campaign_id=campaign_id,
-    ).exclude(
-        publisher_id__in=CampaignUser.objects.filter(
-            campaign_id=campaign_id
-        ).values_list('channels__id', flat=True)
-    ).exclude(
-        publisher_id__in=CampaignPush.objects.filter(
-            campaign_id=campaign_id
-        ).values_list('publishers__id', flat=True)
-    ).order_by(
-        'id'
+    no_push_campaign_publishers = list(
+        CampaignPublisher.objects.filter(
+            campaign_id=campaign_id,
+        ).exclude(
+            publisher_id__in=CampaignUser.objects.filter(
+                campaign_id=campaign_id
+            ).values_list('channels__id', flat=True)
+        ).exclude(
+            publisher_id__in=CampaignPush.objects.filter(
+                campaign_id=campaign_id
+            ).values_list('publishers__id', flat=True)
+        ).order_by(
+            'id'
+        ).values_list(
+            'publisher_id', 'publisher__view_efficiency', 'tariff'
+        )
     )
+    if not no_push_campaign_publishers:
+        return
+
+    publishers_ids, view_efficiency, tariff = np.asarray(no_push_campaign_publishers, dtype=np.int64).T
+    allocate = get_allocator()
+    selected_publishers_ids = publishers_ids[allocate(view_efficiency, tariff, campaign_remain_views)].tolist()
 
-    sum_view_efficiency = 0
+    channel_admins = {}
+    for channel_id, user_id in TelegramChannel.admins.through.objects.filter(
+        telegramchannel_id__in=selected_publishers_ids
+    ).order_by(
+        'telegramchannel_id', 'telegramuser_id'
+    ).values_list(
+        'telegramchannel_id', 'telegramuser_id'
+    ):
+        channel_admins.setdefault(channel_id, []).append(user_id)
+
+    admins_sets = {}
     user_channels = {}
-    for campaign_publisher in no_push_campaign_publishers:
-        if sum_view_efficiency + campaign_publisher.publisher.view_efficiency > campaign_remain_views:
-            continue
+    for channel_id in selected_publishers_ids:
+        users = tuple(channel_admins.get(channel_id, ()))
+        users = admins_sets.setdefault(users, users)
+        user_channels.setdefault(users, []).append(channel_id)
+
+    if not user_channels:
+        return
+
+    bulk_insert = connection.features.can_return_rows_from_bulk_insert
+    with transaction.atomic():
+        if bulk_insert:
+            campaign_pushes = CampaignPush.objects.bulk_create([
+                CampaignPush(campaign_id=campaign_id) for _ in user_channels
+            ])
+        else:  # bulk created pushes have no ids on this backend (MySQL)
+            campaign_pushes = [CampaignPush.objects.create(campaign_id=campaign_id) for _ in user_channels]
+
+        PushPublisher = CampaignPush.publishers.through
+        push_users, push_publishers = [], []
+        for campaign_push, (users, channels) in zip(campaign_pushes, user_channels.items()):
+            push_users.extend(
+                CampaignPushUser(campaign_push_id=campaign_push.id, user_id=user_id) for user_id in users
+            )
+            push_publishers.extend(
+                PushPublisher(campaignpush_id=campaign_push.id, telegramchannel_id=channel_id)
+                for channel_id in channels
+            )
 
-        sum_view_efficiency += campaign_publisher.publisher.view_efficiency
-        user_channels.setdefault(
-            tuple(campaign_publisher.publisher.admins.order_by('id').values_list('id', flat=True)),
-            []
-        ).append(
-            campaign_publisher.publisher
-        )
+        CampaignPushUser.objects.bulk_create(push_users)
+        PushPublisher.objects.bulk_create(push_publishers)
 
-    for i, _users_channels in enumerate(user_channels.items()):
-        users, channels = _users_channels
-        campaign_push = CampaignPush.objects.create(
-            campaign_id=campaign_id
-        )
-        campaign_push.users.set(users)
-        campaign_push.publishers.set(channels)
+    if bulk_insert:  # created pushes register their deadlines on post_save
+        register_push_deadlines(campaign_pushes)
 
+    for i, campaign_push in enumerate(campaign_pushes):
         send_push_to_user.apply_async(
             args=(campaign_push.id,),
             countdown=i * 5
@@ -113,6 +131,8 @@ def send_push_to_user(campaign_push, users=None):
         send a CampaignPush to user if has any channel to get campaign
 
             * campaign pushes with no message_id are not delivered to user successfully just sent
+            * users get push concurrently (see apps.push.fanout) and message ids saved in one bulk update
+            * campaign photo is uploaded at most once per bot token, then its file_id is used (see apps.push.media)
 
     :param campaign_push:
     :param users:
@@ -137,43 +157,99 @@ def send_push_to_user(campaign_push, users=None):
             campaign_push.get_push_data(),
         ),
         'parse_mode': 'HTML',
-        'photo': campaign_push.campaign.file.get_file()
     }
 
-    for user in users:
-        try:
-            response = bot.send_photo(chat_id=user.user_id, **kwargs)
-            CampaignPushUser.objects.filter(
-                campaign_push=campaign_push,
-                user=user,
-            ).update(
-                message_id=response.message_id
-            )
-        except Exception as e:
-            logger.error(f"send push campaign: #{campaign_push.id} failed, error{e}")
+    user_pushes = {
+        user_push.user.user_id: user_push
+        for user_push in CampaignPushUser.objects.select_related(
+            'user'
+        ).filter(
+            campaign_push=campaign_push,
+            user__in=users
+        )
+    }
+    chat_ids = list(user_pushes)
+
+    results = []
+    campaign_file = campaign_push.campaign.file
+    kwargs['photo'], upload = resolve_photo(bot, campaign_file)
+    while upload and chat_ids:
+        # upload photo once then concurrent sends use it's telegram file_id
+        kwargs['photo'] = campaign_file.get_file()
+        result = fan_out(lambda chat_id: bot.send_photo(chat_id=chat_id, **kwargs), chat_ids[:1])
+        results.extend(result)
+        chat_ids = chat_ids[1:]
+        if result[0][1] is not None:
+            kwargs['photo'] = remember_file_id(upload, result[0][1])
+            upload = None
+
+    if upload:
+        release_upload(upload)
+
+    results.extend(fan_out(lambda chat_id: bot.send_photo(chat_id=chat_id, **kwargs), chat_ids))
+
+    delivered_user_pushes = []
+    now = timezone.now()
+    for chat_id, response, error in results:
+        if error is not None:
+            logger.error(f"send push campaign: #{campaign_push.id} to: {chat_id} failed, error{error}")
+            continue
 
+        user_push = user_pushes[chat_id]
+        user_push.message_id = response.message_id
+        user_push.updated_time = now
+        delivered_user_pushes.append(user_push)
 
-@shared_task()
-def check_expire_campaign_push():
-    expired_campaign_pushes = CampaignPush.objects.prefetch_related(
-        'publisher__admins'
-    ).exclude(
-        status__in=(CampaignPush.STATUS_EXPIRED, CampaignPush.STATUS_REJECTED)
-    ).filter(
-        created_time__lte=timezone.now() - timezone.timedelta(minutes=settings.EXPIRE_PUSH_MINUTE),
-        created_time__gte=timezone.now() - timezone.timedelta(minutes=2 * settings.EXPIRE_PUSH_MINUTE),
-        campaign__status=Campaign.STATUS_APPROVED,
-        campaign__is_enable=True,
+    CampaignPushUser.objects.bulk_update(delivered_user_pushes, fields=['message_id', 'updated_time'])
+
+
+def _cancel_expired_pushes(campaign_pushes):
+    expired_campaign_pushes_ids = list(
+        campaign_pushes.exclude(
+            status__in=(CampaignPush.STATUS_EXPIRED, CampaignPush.STATUS_REJECTED)
+        ).filter(
+            campaign__status=Campaign.STATUS_APPROVED,
+            campaign__is_enable=True,
+        ).values_list('id', flat=True)
     )
 
-    expired_campaign_pushes_ids = list(expired_campaign_pushes.values_list('id', flat=True))
-    if expired_campaign_pushes_ids:
+    batch_size = settings.EXPIRE_PUSH_BATCH_SIZE
+    for i in range(0, len(expired_campaign_pushes_ids), batch_size):
         cancel_push.apply_async(
-            kwargs=dict(campaign_pushes=expired_campaign_pushes_ids),
+            kwargs=dict(campaign_pushes=expired_campaign_pushes_ids[i:i + batch_size]),
             countdown=1
         )
 
 
+@shared_task()
+def fire_expired_campaign_pushes():
+    """
+        cancel pushes which their expire deadline passed,
+        deadlines are registered in a timer wheel when pushes created (see apps.push.expiry)
+    :return:
+    """
+    due_campaign_pushes_ids = pop_due_pushes()
+    if due_campaign_pushes_ids:
+        _cancel_expired_pushes(CampaignPush.objects.filter(id__in=due_campaign_pushes_ids))
+
+
+@shared_task()
+def check_expire_campaign_push():
+    """
+        reconciliation sweep for no reaction pushes which missed the expire timer wheel
+        (cache eviction, worker was down, ...)
+    :return:
+    """
+    now = timezone.now()
+    # same status filter as the wheel, pushes older than the window were covered by earlier sweeps
+    _cancel_expired_pushes(
+        CampaignPush.objects.filter(
+            created_time__gte=now - timezone.timedelta(minutes=settings.EXPIRE_PUSH_SWEEP_MINUTE),
+            created_time__lte=now - timezone.timedelta(minutes=settings.EXPIRE_PUSH_MINUTE + 1),
+        )
+    )
+
+
 @shared_task
 def cancel_push(**kwargs):
     """
@@ -183,8 +259,11 @@ def cancel_push(**kwargs):
 
             update CampaignPublish status and delete message in user chat
 
+            * delivered messages are loaded in one query and deleted concurrently
+            * pushes status changes in one update then their cached push data is invalidated
+
     :param kwargs:
-    :return:
+    :return: deleted and failed CampaignPushUser ids
     """
 
     campaign_pushes = kwargs.get('campaign_pushes')
@@ -196,27 +275,46 @@ def cancel_push(**kwargs):
         status = CampaignPush.STATUS_REJECTED
         campaign_pushes_ids = [campaign_pushes]
 
-    campaign_pushes = CampaignPush.objects.prefetch_related(
-        'user_pushes__user'
-    ).filter(
-        id__in=campaign_pushes_ids,
+    user_pushes = list(
+        CampaignPushUser.objects.filter(
+            campaign_push_id__in=campaign_pushes_ids,
+            message_id__isnull=False
+        ).values_list(
+            'id', 'user__user_id', 'message_id'
+        )
     )
 
-    for campaign_push in campaign_pushes:
-
-        if campaign_push.status != CampaignPush.STATUS_RECEIVED:
-            campaign_push.status = status
+    results = fan_out(
+        lambda user_push: bot.delete_message(user_push[1], user_push[2]),
+        user_pushes
+    )
 
-        for user_push in campaign_push.user_pushes.filter(message_id__isnull=False):
-            try:
-                bot.delete_message(
-                    user_push.user.user_id,
-                    user_push.message_id
-                )
-            except Exception as e:
-                logger.error(f"delete push: {campaign_push} failed, error: {e}")
+    outcomes = {'deleted': [], 'failed': []}
+    for (user_push_id, chat_id, message_id), _, error in results:
+        if error is None:
+            outcomes['deleted'].append(user_push_id)
+        else:
+            outcomes['failed'].append(user_push_id)
+            logger.error(f"delete push message: {message_id} chat: {chat_id} failed, error: {error}")
+
+    canceled_pushes = list(
+        CampaignPush.objects.filter(
+            id__in=campaign_pushes_ids
+        ).exclude(
+            status=CampaignPush.STATUS_RECEIVED
+        ).only('id', 'campaign_id')
+    )
+    CampaignPush.objects.filter(
+        id__in=[campaign_push.id for campaign_push in canceled_pushes]
+    ).update(
+        status=status,
+        updated_time=timezone.now()
+    )
+    # update() sends no post_save, drop cached push data here
+    for campaign_push in canceled_pushes:
+        campaign_push.invalidate_push_data()
 
-    CampaignPush.objects.bulk_update(campaign_pushes, fields=['updated_time', 'status'])
+    return outcomes
 
 
 @shared_task
@@ -225,7 +323,8 @@ def check_send_shot_push():
         when campaign is close to it's end datetime send push to campaign users to send
         their screen shots.
 
-        cache sent push data for avoid of resend
+        cache sent push data for avoid of resend, every pushed user is a member of campaign CacheMemberSet
+        and pushes are sent concurrently and recorded in batches
 
     :return:
     """
@@ -250,24 +349,22 @@ def check_send_shot_push():
 
     for campaign in campaigns:
         push_text = SEND_SHOT_PUSH.format(campaign.title)
-        pushed_campaign_users = cache.get(f"push_campaign_{campaign.id}", set())
-        campaign_users = set(
-            campaign.campaignuser_set.exclude(
-                user__user_id__in=pushed_campaign_users
-            ).values_list('user__user_id', flat=True)
-        )
-
-        for campaign_user_chat_id in campaign_users:
-            try:
-                bot.send_message(
-                    chat_id=campaign_user_chat_id,
-                    text=push_text,
-                    parse_mode="MARKDOWN"
-                )
-                pushed_campaign_users.add(campaign_user_chat_id)
+        pushed_campaign_users = CacheMemberSet(f"push_campaign_{campaign.id}", 4 * 60 * 60)
+        campaign_users = {campaign_user.user.user_id for campaign_user in campaign.campaignuser_set.all()}
+        campaign_users = list(campaign_users - pushed_campaign_users.contains_many(campaign_users))
+
+        for i in range(0, len(campaign_users), SHOT_PUSH_BATCH_SIZE):
+            results = fan_out(
+                lambda chat_id: bot.send_message(chat_id=chat_id, text=push_text, parse_mode="MARKDOWN"),
+                campaign_users[i:i + SHOT_PUSH_BATCH_SIZE]
+            )
 
-            except Exception as e:
-                logger.error(f"send shot push to: {campaign_user_chat_id} "
-                             f"for campaign: {campaign.title} failed, error: {e}")
+            sent_chat_ids = []
+            for campaign_user_chat_id, _, error in results:
+                if error is None:
+                    sent_chat_ids.append(campaign_user_chat_id)
+                else:
+                    logger.error(f"send shot push to: {campaign_user_chat_id} "
+                                 f"for campaign: {campaign.title} failed, error: {error}")
 
-            cache.set(f"push_campaign_{campaign.id}", pushed_campaign_users, 4 * 60 * 60) 
+            pushed_campaign_users.add_many(sent_chat_ids)
@@ -0,0 +1,217 @@
+import json
+import time
+import itertools
+import threading
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.push.allocators import ALLOCATORS, greedy_allocator, sorted_prefix_allocator, knapsack_allocator
+from apps.push.media import resolve_photo, remember_file_id, release_upload
+from apps.push.models import CampaignPush
+from apps.telegram_adv.models import TelegramChannel, Campaign
+from apps.telegram_adv.tests import create_campaign_user
+from apps.push.tasks import cancel_push, check_expire_campaign_push
+from apps.utils.telegram_gateway import BotGateway
+
+
+class ChannelAllocatorTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.view_efficiency = rng.randint(100, 50000, size=10000)
+        self.tariff = rng.randint(1000, 10000, size=10000)
+
+    def test_allocators_never_overshoot(self):
+        for remain_views in (0, 150, 30000, 1000000, 10 ** 9):
+            for name, allocate in ALLOCATORS.items():
+                selected = allocate(self.view_efficiency, self.tariff, remain_views)
+                self.assertEqual(len(set(selected.tolist())), len(selected), name)
+                self.assertLessEqual(self.view_efficiency[selected].sum(), remain_views, name)
+
+    def test_allocators_fill_at_least_as_greedy(self):
+        greedy_views = self.view_efficiency[greedy_allocator(self.view_efficiency, self.tariff, 1000000)].sum()
+        for name, allocate in ALLOCATORS.items():
+            selected = allocate(self.view_efficiency, self.tariff, 1000000)
+            self.assertGreaterEqual(self.view_efficiency[selected].sum(), greedy_views, name)
+
+    def test_knapsack_fills_at_least_as_greedy_and_sorted_prefix(self):
+        # fewer candidates than KNAPSACK_MAX_ITEMS, knapsack runs it's quantized DP
+        for seed in range(5):
+            rng = np.random.RandomState(seed)
+            view_efficiency = rng.randint(100, 50000, size=1000)
+            tariff = rng.randint(1000, 10000, size=1000)
+            for remain_views in (30000, 1000000, np.int64(1000000)):
+                knapsack_views = view_efficiency[knapsack_allocator(view_efficiency, tariff, remain_views)].sum()
+                self.assertLessEqual(knapsack_views, remain_views)
+                for allocate in (greedy_allocator, sorted_prefix_allocator):
+                    selected = allocate(view_efficiency, tariff, remain_views)
+                    self.assertGreaterEqual(knapsack_views, view_efficiency[selected].sum())
+
+    def test_knapsack_is_exact_on_small_views(self):
+        rng = np.random.RandomState(1)
+        for _ in range(100):
+            views = rng.randint(1, 50, size=rng.randint(1, 9))
+            remain_views = int(rng.randint(1, 150))
+            best = max(
+                sum(combination)
+                for k in range(len(views) + 1)
+                for combination in itertools.combinations(views.tolist(), k)
+                if sum(combination) <= remain_views
+            )
+            selected = knapsack_allocator(views, views, remain_views)
+            self.assertEqual(views[selected].sum(), best)
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """
+        fake telegram Bot API, first sendMessage answers 429 with retry_after then all calls succeed
+    """
+    calls = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.calls.append((time.time(), self.path))
+        if len(self.calls) == 1:
+            status, body = 429, {
+                'ok': False, 'error_code': 429,
+                'description': 'Too Many Requests: retry after 1', 'parameters': {'retry_after': 1}
+            }
+        else:
+            status, body = 200, {
+                'ok': True,
+                'result': {'message_id': len(self.calls), 'date': 0, 'chat': {'id': 1, 'type': 'private'}}
+            }
+
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BotGatewayTestCase(SimpleTestCase):
+    def setUp(self):
+        FakeBotAPIHandler.calls = []
+        self.server = HTTPServer(('127.0.0.1', 0), FakeBotAPIHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        telegram_bot = dict(settings.TELEGRAM_BOT, API_URL=f'http://127.0.0.1:{self.server.server_port}/bot', PROXY='')
+        self.settings = override_settings(
+            TELEGRAM_BOT=telegram_bot,
+            TELEGRAM_GLOBAL_RATE=5,
+            TELEGRAM_CHAT_INTERVAL=1,
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_after_and_global_rate(self):
+        gateway = BotGateway('123:fake')
+        start = time.time()
+        messages = [gateway.send_message(chat_id=chat_id, text='hi') for chat_id in range(1, 12)]
+
+        self.assertEqual(len(messages), 11)
+        # first call got 429 and retried after a second
+        self.assertGreaterEqual(FakeBotAPIHandler.calls[1][0] - FakeBotAPIHandler.calls[0][0], 1)
+        # 11 calls with 5 calls per second need at least two more windows
+        self.assertGreaterEqual(time.time() - start, 2)
+
+
+class CancelPushTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def test_cancel_push_invalidates_push_data(self):
+        campaign_push = CampaignPush.objects.create(campaign_id=1)
+        campaign_push.publishers.add(1)
+        cache.set(campaign_push._push_data_key(), {'stale': []})
+
+        cancel_push(campaign_pushes=campaign_push.id)
+
+        campaign_push.refresh_from_db()
+        self.assertEqual(campaign_push.status, CampaignPush.STATUS_REJECTED)
+        self.assertEqual(campaign_push.get_push_data(), campaign_push._build_push_data())
+
+
+class PushDataInvalidationTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def test_channel_campaign_users_clear_invalidates_push_data(self):
+        campaign_user = create_campaign_user()
+        campaign_user.channels.add(1)
+        campaign_push = CampaignPush.objects.create(campaign_id=1)
+        push_data_key = campaign_push._push_data_key()
+
+        TelegramChannel.objects.get(id=1).campaignuser_set.clear()
+        self.assertNotEqual(campaign_push._push_data_key(), push_data_key)
+
+    def test_evicted_version_never_reuses_push_data_key(self):
+        campaign_push = CampaignPush.objects.create(campaign_id=1)
+        push_data_key = campaign_push._push_data_key()
+
+        cache.delete(CampaignPush._push_data_version_key(1))
+        self.assertNotEqual(campaign_push._push_data_key(), push_data_key)
+
+
+class PushExpiryTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def test_create_push_survives_evicted_wheel_slot(self):
+        with mock.patch('apps.push.expiry.cache.incr', side_effect=ValueError):
+            campaign_push = CampaignPush.objects.create(campaign_id=1)
+        self.assertTrue(CampaignPush.objects.filter(id=campaign_push.id).exists())
+
+    @mock.patch('apps.push.tasks.cancel_push.apply_async')
+    def test_sweep_expires_received_pushes_in_window(self, apply_async):
+        Campaign.objects.filter(id=1).update(status=Campaign.STATUS_APPROVED, is_enable=True)
+        now = timezone.now()
+        received_push = CampaignPush.objects.create(campaign_id=1, status=CampaignPush.STATUS_RECEIVED)
+        old_push = CampaignPush.objects.create(campaign_id=1)
+        CampaignPush.objects.filter(id=received_push.id).update(
+            created_time=now - timezone.timedelta(minutes=settings.EXPIRE_PUSH_MINUTE + 2)
+        )
+        CampaignPush.objects.filter(id=old_push.id).update(
+            created_time=now - timezone.timedelta(minutes=settings.EXPIRE_PUSH_SWEEP_MINUTE + 1)
+        )
+
+        check_expire_campaign_push()
+        swept_ids = [i for call in apply_async.call_args_list for i in call[1]['kwargs']['campaign_pushes']]
+        self.assertIn(received_push.id, swept_ids)
+        self.assertNotIn(old_push.id, swept_ids)
+
+
+class PushMediaTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.gateway = mock.Mock()
+        self.gateway.name = 'bot'
+        patcher = mock.patch('apps.push.media.get_content_hash', return_value='hash')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_upload_after_wait_keeps_other_worker_lock(self):
+        _, upload = resolve_photo(self.gateway, mock.Mock(), wait=0)
+        lock_key = f'{upload.key}_upload'
+        self.assertEqual(cache.get(lock_key), upload.token)
+
+        _, late_upload = resolve_photo(self.gateway, mock.Mock(), wait=0)
+        self.assertIsNone(late_upload.token)
+        release_upload(late_upload)
+        response = mock.Mock(photo=[mock.Mock(file_id='file_id')])
+        remember_file_id(late_upload, response)
+        self.assertEqual(cache.get(lock_key), upload.token)
+
+        release_upload(upload)
+        self.assertIsNone(cache.get(lock_key))
+        self.assertEqual(resolve_photo(self.gateway, mock.Mock()), ('file_id', None))
@@ -5,7 +5,8 @@ from django_admin_listfilter_dropdown.filters import RelatedDropdownFilter
 from khayyam import JalaliDate
 
 from django.contrib import admin, messages
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count
 from django import forms
 from django.shortcuts import reverse, render, redirect
 from django.utils import timezone
@@ -14,9 +15,14 @@ from django.urls import path
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 from django.core.cache import cache
-from django.core.paginator import Paginator
 
-from apps.utils.admin import ReadOnlyAdmin, ReadOnlyTabularInline, CampaignFilter
+from apps.utils.admin import (
+    ReadOnlyAdmin,
+    ReadOnlyTabularInline,
+    CampaignFilter,
+    AnnotatedChangeListMixin,
+    EstimatedCountPaginator
+)
 from apps.telegram_bot.tasks import read_campaign_posts_views, get_files_id
 from .models import (
     TelegramChannel,
@@ -37,7 +43,8 @@ from .models import (
 )
 
 from .forms import ImportCampaignUserForm, ImportCampaignContentFilesForm, BankAccountExchangeForm
-from .tasks import check_to_calculate_campaign_user, exchange_bank_account_task
+from .pricing import get_campaign_posts_prices, get_campaign_users_prices, get_campaign_users_tariffs
+from .tasks import check_to_calculate_campaign_user, exchange_bank_account_task, warm_campaign_short_links_task
 
 logger = logging.getLogger(__name__)
 
@@ -108,6 +115,7 @@ class HasShebaListFilter(admin.SimpleListFilter):
 @admin.register(TelegramChannel)
 class TelegramChannelAdmin(admin.ModelAdmin):
     list_display = ['tag', 'id', 'view_efficiency', 'updated_time', 'member_no', 'sheba']
+    list_select_related = ['sheba']
     search_fields = ['tag', 'user__username']
     raw_id_fields = ['sheba']
     filter_horizontal = ['admins']
@@ -164,6 +172,7 @@ class ShortLinkLogAdmin(ReadOnlyAdmin):
         'short_link', 'id', 'ip_count', 'hit_count',
     ]
     ordering = ('-pk',)
+    keyset_pagination = True
 
 
 def format_date(date):
@@ -172,14 +181,6 @@ def format_date(date):
     return jdate.todate()
 
 
-class DummyCountPaginator(Paginator):
-    def _get_count(self):
-        self.allow_empty_first_page = False
-        return 7777777
-
-    count = property(_get_count)
-
-
 @admin.register(ReceiverChannel)
 class ReceiverChannelAdmin(admin.ModelAdmin):
     pass
@@ -191,7 +192,11 @@ class TelegramAgentAdmin(admin.ModelAdmin):
 
 
 def make_approved(modeladmin, request, queryset):
+    approved_ids = list(queryset.exclude(status=Campaign.STATUS_APPROVED).values_list('id', flat=True))
     queryset.update(status=Campaign.STATUS_APPROVED)
+    # update() sends no post_save, warm short links of newly approved campaigns here
+    for campaign_id in approved_ids:
+        transaction.on_commit(lambda campaign_id=campaign_id: warm_campaign_short_links_task.delay(campaign_id))
 make_approved.short_description = _("Mark selected Campaigns as approved")
 
 
@@ -215,11 +220,14 @@ class CampaignFileInline(admin.TabularInline):
 
 
 @admin.register(Campaign)
-class CampaignAdmin(admin.ModelAdmin):
+class CampaignAdmin(AnnotatedChangeListMixin, admin.ModelAdmin):
     list_display = [
         'title', 'pk', 'status', 'start_datetime', 'end_datetime',
         'get_report_url', 'publish_count', 'is_enable', 'updated_time'
     ]
+    list_annotations = {
+        '_publish_count': Count('campaignuser', distinct=True)
+    }
     list_filter = ['status', 'is_enable']
     search_fields = ['title']
     filter_horizontal = ['receiver_agents']
@@ -234,10 +242,11 @@ class CampaignAdmin(admin.ModelAdmin):
 
     def publish_count(self, obj):
         if obj.status == Campaign.STATUS_APPROVED:
-            return obj.campaignuser_set.count()
+            return obj._publish_count
         else:
             return '-'
     publish_count.short_description = _('channels')
+    publish_count.admin_order_field = '_publish_count'
 
     def get_report_url(self, obj):
         return mark_safe(
@@ -425,11 +434,11 @@ class CampaignUserPostsInline(admin.TabularInline):
 
 
 @admin.register(CampaignUser)
-class CampaignUserAdmin(ReadOnlyAdmin):
+class CampaignUserAdmin(AnnotatedChangeListMixin, ReadOnlyAdmin):
     super_user_can = True
 
     list_display = [
-        'campaign', 'user', 'id', 'channel', 'tariff',
+        'campaign', 'user', 'id', 'channel', 'channels_tariff',
         'sheba_owner', 'is_paid', 'receipt_price',
         'calculated_price', 'statistics'
     ]
@@ -441,6 +450,7 @@ class CampaignUserAdmin(ReadOnlyAdmin):
     ]
 
     list_select_related = ['campaign', 'user']
+    list_prefetch_related = ('channels',)
     raw_id_fields = ['campaign', 'user']
     filter_horizontal = ['channels']
     search_fields = ['campaign__title', 'user__username', 'user__user_id']
@@ -461,7 +471,7 @@ class CampaignUserAdmin(ReadOnlyAdmin):
         return search_results, _b
 
     def channel(self, obj):
-        return obj.channel_tags
+        return ", ".join(channel.tag for channel in obj.channels.all())
     channel.short_description = _('channels')
 
     def is_paid(self, obj):
@@ -486,8 +496,20 @@ class CampaignUserAdmin(ReadOnlyAdmin):
             readonly_fields = self.readonly_fields
         return readonly_fields
 
+    def load_page(self, request, objects):
+        campaign_users_ids = [obj.id for obj in objects]
+        prices = get_campaign_users_prices(campaign_users_ids)
+        tariffs = get_campaign_users_tariffs(campaign_users_ids)
+        for obj in objects:
+            obj._calculated_price = prices[obj.id]
+            obj._channels_tariff = tariffs[obj.id]
+
+    def channels_tariff(self, obj):
+        return obj._channels_tariff
+    channels_tariff.short_description = _('tariff')
+
     def calculated_price(self, obj):
-        return obj.calculate_price()
+        return obj._calculated_price
 
     def has_change_permission(self, request, obj=None):
         return request.user.is_superuser or obj is None or obj.receipt_price is None
@@ -640,7 +662,7 @@ class CampaignPostAdminForm(forms.ModelForm):
 
 
 @admin.register(CampaignPost)
-class CampaignPostAdmin(ReadOnlyAdmin):
+class CampaignPostAdmin(AnnotatedChangeListMixin, ReadOnlyAdmin):
     super_user_can = True
     form = CampaignPostAdminForm
     list_display = [
@@ -652,7 +674,7 @@ class CampaignPostAdmin(ReadOnlyAdmin):
         'campaign_content', 'campaign_user', 'campaign_file',
         'approve_time', 'screen_time'
     ]
-    list_select_related = ['campaign_content', 'campaign_user', 'campaign_file']
+    list_select_related = ['campaign_content', 'campaign_user__user', 'campaign_file']
     search_fields = ['=campaign_user__user__username']
     actions = [approve_screenshots, update_campaign_posts_view]
     list_filter = (
@@ -663,6 +685,8 @@ class CampaignPostAdmin(ReadOnlyAdmin):
     )
 
     list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_search_results(self, request, queryset, search_term):
         search_results, _b = super().get_search_results(request, queryset, search_term)
@@ -677,16 +701,21 @@ class CampaignPostAdmin(ReadOnlyAdmin):
     def view_type(self, obj):
         return obj.campaign_content.view_type
 
+    def load_page(self, request, objects):
+        prices = get_campaign_posts_prices([obj.id for obj in objects if obj._has_tariff])
+        for obj in objects:
+            obj._price = prices.get(obj.id, 0)
+
     def price(self, obj):
         if obj._has_tariff:
-            return f"{obj.calculate_price():,}"
+            return f"{obj._price:,}"
         else:
             return 'X'
 
     def last_log_view(self, obj):
-        last_log = obj.logs.last()
-        if last_log:
-            return last_log.banner_views
+        view_rollup = getattr(obj, 'view_rollup', None)
+        if view_rollup is not None and view_rollup.last_banner_views is not None:
+            return view_rollup.last_banner_views
         return '-'
 
     def user(self, obj):
@@ -737,7 +766,7 @@ class CampaignPostLogAdmin(ReadOnlyAdmin):
         ('campaign_post__campaign_content__campaign', RelatedDropdownFilter),
     ]
     search_fields = ['=campaign_post__id']
-    paginator = DummyCountPaginator
+    keyset_pagination = True
 
     def campaign_user(self, obj):
         return obj.campaign_post.campaign_user.id
@@ -5,9 +5,12 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.exceptions import ParseError
 
+from django.utils.http import quote_etag
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.translation import ugettext_lazy as _
 
-from apps.telegram_adv.api.functions import get_campaign_publisher_views, test_create_campaign
+from apps.telegram_adv.api.functions import test_create_campaign
+from apps.telegram_adv.reports import get_campaign_report
 from apps.telegram_adv.api.serializers import (
     CampaignSerializer,
     CampaignFileSerializer,
@@ -34,10 +37,23 @@ class CampaignViewSet(BaseViewSet,
         'contents'
     ).all()
 
+    def get_queryset(self):
+        if self.action == 'report':
+            return Campaign.objects.only('id')
+        return super().get_queryset()
+
     @action(methods=['get'], detail=True)
     def report(self, request, *args, **kwargs):
-        report_data = get_campaign_publisher_views(campaign_id=self.get_object().id)
-        return Response(report_data)
+        report = get_campaign_report(campaign_id=self.get_object().id)
+        # no Last-Modified, rollup times don't change when a content is deleted
+        etag = quote_etag(report.etag)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(report.data)
+
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     @action(methods=['get'], detail=True)
     def test(self, request, *args, **kwargs):
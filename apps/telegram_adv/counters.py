@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Campaign, CampaignContent, CampaignContentViews
+
+DISABLE_LOCK_TIMEOUT = 10
+
+
+def _content_key(campaign_content_id):
+    return f'content_views_{campaign_content_id}'
+
+
+def _reached_key(campaign_id):
+    return f'campaign_max_view_reached_{campaign_id}'
+
+
+def _incr(key, delta):
+    try:
+        if delta >= 0:
+            return cache.incr(key, delta)
+        return cache.decr(key, -delta)
+    except ValueError:  # key evicted or never set
+        return None
+
+
+def _seed_counter(campaign_content_id):
+    """
+        content counter missed, seed it from CampaignContentViews rollup which already has the new views
+
+    :param campaign_content_id:
+    :return: content views, None if cache is not available
+    """
+    views = CampaignContentViews.objects.filter(
+        campaign_content_id=campaign_content_id
+    ).values_list(
+        'sum_views', flat=True
+    ).first() or 0
+    if cache.add(_content_key(campaign_content_id), views, None):
+        return views
+    return cache.get(_content_key(campaign_content_id))
+
+
+def record_views(content, delta):
+    """
+        add new banner views of a partial content to it's content counter,
+        when content views reach campaign max_view campaign is flagged and disable task called
+        after views are committed, content rollup must have the views difference before
+
+    :param content: CampaignContent values with id, campaign_id, view_type and campaign__max_view
+    :param delta: views difference, negative when a post disabled or views corrected
+    :return:
+    """
+    if not delta or content['view_type'] != CampaignContent.TYPE_VIEW_PARTIAL:
+        return
+
+    content_views = _incr(_content_key(content['id']), delta)
+    if content_views is None:
+        content_views = _seed_counter(content['id'])
+
+    if content_views is not None and content_views >= content['campaign__max_view']:
+        cache.set(_reached_key(content['campaign_id']), True, None)
+        if cache.add("disable_campaign_by_max_view_lock", 1, DISABLE_LOCK_TIMEOUT):
+            from .tasks import disable_campaign_by_max_view
+            transaction.on_commit(disable_campaign_by_max_view.delay)
+
+
+def reached_max_view_campaigns(campaigns_ids):
+    """
+    :param campaigns_ids:
+    :return: set of campaigns ids which one of their partial contents views reached max_view
+    """
+    keys = {_reached_key(campaign_id): campaign_id for campaign_id in campaigns_ids}
+    return {keys[key] for key, reached in cache.get_many(list(keys)).items() if reached}
+
+
+def reconcile_view_counters():
+    """
+        set counters of approved campaigns from CampaignContentViews rollup
+    """
+    contents = CampaignContentViews.objects.filter(
+        campaign_content__view_type=CampaignContent.TYPE_VIEW_PARTIAL,
+        campaign_content__campaign__status=Campaign.STATUS_APPROVED,
+    ).values_list(
+        'campaign_content_id', 'campaign_content__campaign_id', 'campaign_content__campaign__max_view', 'sum_views'
+    )
+
+    counters = {}
+    campaigns_reached = {}
+    for content_id, campaign_id, max_view, views in contents:
+        counters[_content_key(content_id)] = views
+        campaigns_reached[campaign_id] = campaigns_reached.get(campaign_id, False) or views >= max_view
+
+    counters.update({_reached_key(campaign_id): reached for campaign_id, reached in campaigns_reached.items()})
+    cache.set_many(counters, None)
@@ -0,0 +1,156 @@
+import time
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.utils.hyperloglog import HyperLogLog, hash_value
+
+from .models import ShortLinkLog
+from .shortlink_stats import merge_ip_sketches
+
+logger = logging.getLogger(__name__)
+
+HIT_BUFFER_CURSOR_KEY = 'hit_buffer_cursor'
+HIT_BUFFER_DEPTH_KEY = 'hit_buffer_depth'
+HIT_BUFFER_LOCK_KEY = 'hit_buffer_flush_lock'
+
+# buckets which are not flushed in this many intervals are lost (worker or cache crash)
+MAX_PENDING_BUCKETS = 10
+
+
+def _bucket(now=None):
+    return int((now or time.time()) // settings.SHORT_LINK_BUFFER_SECONDS)
+
+
+def _key(bucket, *parts):
+    return '_'.join(['hit_buffer', str(bucket)] + [str(part) for part in parts])
+
+
+def _incr(key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return None
+
+
+def record_hit(short_link_id, ip, now=None):
+    """
+        coalesce a short link click in cache counters of current time bucket instead of a database write,
+        ip is counted once per short link and bucket and it's hash is kept for HyperLogLog sketches
+
+    :param short_link_id:
+    :param ip:
+    :param now: timestamp
+    :return:
+    """
+    bucket = _bucket(now)
+    timeout = settings.SHORT_LINK_BUFFER_SECONDS * MAX_PENDING_BUCKETS
+
+    if cache.add(_key(bucket, 'link', short_link_id), 1, timeout):
+        slot = _incr(_key(bucket), timeout)
+        if slot is not None:
+            cache.set(_key(bucket, slot), short_link_id, timeout)
+
+    _incr(_key(bucket, 'hits', short_link_id), timeout)
+
+    ip_hash = hash_value(ip)
+    if cache.add(_key(bucket, 'ip', short_link_id, ip_hash), 1, timeout):
+        index = _incr(_key(bucket, 'ips', short_link_id), timeout)
+        if index is not None:
+            cache.set(_key(bucket, 'ip_hash', short_link_id, index), ip_hash, timeout)
+
+
+def _pending_buckets(now=None):
+    current_bucket = _bucket(now)
+    cursor = cache.get(HIT_BUFFER_CURSOR_KEY, current_bucket - MAX_PENDING_BUCKETS)
+    return range(max(cursor, current_bucket - MAX_PENDING_BUCKETS), current_bucket)
+
+
+def buffer_depth(now=None):
+    """
+    :return: number of buffered (short link, bucket) counters which are not flushed yet
+    """
+    current_bucket = _bucket(now)
+    return sum(cache.get(_key(bucket), 0) for bucket in range(_pending_buckets(now).start, current_bucket + 1))
+
+
+def _flush_bucket(bucket):
+    """
+        write one closed bucket counters as ShortLinkLog rows and merge it's ips hashes into hourly sketches
+        in one transaction, cursor is moved after bucket when it's committed
+
+    :param bucket:
+    :return: number of created logs
+    """
+    count = cache.get(_key(bucket), 0)
+    slots = [_key(bucket, slot) for slot in range(1, count + 1)]
+    short_links_ids = list(cache.get_many(slots).values())
+
+    counter_keys = [_key(bucket, name, link_id) for link_id in short_links_ids for name in ('hits', 'ips')]
+    counters = cache.get_many(counter_keys)
+
+    logs = [
+        ShortLinkLog(
+            short_link_id=link_id,
+            hit_count=counters.get(_key(bucket, 'hits', link_id), 0),
+            ip_count=counters.get(_key(bucket, 'ips', link_id), 0)
+        )
+        for link_id in short_links_ids
+    ]
+    links_ip_hash_keys = {
+        log.short_link_id: [
+            _key(bucket, 'ip_hash', log.short_link_id, index) for index in range(1, log.ip_count + 1)
+        ]
+        for log in logs
+    }
+    ip_hash_keys = [key for keys in links_ip_hash_keys.values() for key in keys]
+    ip_hashes = cache.get_many(ip_hash_keys)
+    sketches = {}
+    for link_id, keys in links_ip_hash_keys.items():
+        sketches[link_id] = HyperLogLog()
+        sketches[link_id].add_hashes(ip_hashes[key] for key in keys if key in ip_hashes)
+
+    # logs, sketches and cursor are one unit, a failed merge does not leave logs which are written again
+    bucket_time = datetime.fromtimestamp(bucket * settings.SHORT_LINK_BUFFER_SECONDS)
+    with transaction.atomic():
+        ShortLinkLog.objects.bulk_create(logs)
+        # created_time is auto_now_add and set to flush time by bulk_create, logs belong to bucket time
+        ShortLinkLog.objects.filter(id__in=[log.id for log in logs]).update(created_time=bucket_time)
+        merge_ip_sketches(bucket_time.replace(minute=0, second=0, microsecond=0), sketches)
+        transaction.on_commit(lambda: cache.set(HIT_BUFFER_CURSOR_KEY, bucket + 1, None))
+
+    cache.delete_many(
+        slots + counter_keys + ip_hash_keys + [_key(bucket)] +
+        [_key(bucket, 'link', link_id) for link_id in short_links_ids]
+    )
+    return len(logs)
+
+
+def flush_hit_buffer(now=None):
+    """
+        write closed buckets counters as ShortLinkLog rows with one bulk insert per bucket
+        and merge buckets ips hashes into hourly HyperLogLog sketches,
+        cursor is moved after every bucket so a failed flush does not write flushed buckets again
+
+    :param now: timestamp
+    :return: number of created logs, None if another flush is running
+    """
+    if not cache.add(HIT_BUFFER_LOCK_KEY, 1, settings.SHORT_LINK_BUFFER_SECONDS * MAX_PENDING_BUCKETS):
+        logger.warning("short link hit buffer flush is already running")
+        return None
+
+    try:
+        created = 0
+        for bucket in _pending_buckets(now):
+            created += _flush_bucket(bucket)
+    finally:
+        cache.delete(HIT_BUFFER_LOCK_KEY)
+
+    depth = buffer_depth(now)
+    cache.set(HIT_BUFFER_DEPTH_KEY, depth, None)
+    logger.info(f"short link hit buffer flushed logs: {created} depth: {depth}")
+    return created
@@ -0,0 +1,102 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.utils.lru_cache import LocalLRUCache
+from apps.utils.url_encoder import EncoderError
+
+from .models import ShortLink, url_encoder
+
+# cached for codes which has no campaign link so they don't hit database on every click
+MISSING_REDIRECT = ''
+
+_local_cache = LocalLRUCache(settings.SHORT_LINK_LOCAL_CACHE_SIZE, settings.SHORT_LINK_LOCAL_CACHE_TIMEOUT)
+
+
+def _cache_key(short_link_id):
+    return f'short_link_redirect_{short_link_id}'
+
+
+def build_redirect_url(link, extra_data):
+    """
+        add campaign link utm params (extra_data) to link query string, extra_data wins on same params
+
+    :param link:
+    :param extra_data: dict
+    :return: url
+    """
+    if not extra_data:
+        return link
+
+    scheme, netloc, path, query, fragment = urlsplit(link)
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    params.update(extra_data)
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+
+def _load_redirects(short_links):
+    """
+    :param short_links: ShortLink queryset
+    :return: dict of short link id and it's redirect url
+    """
+    return {
+        short_link_id: build_redirect_url(link, extra_data)
+        for short_link_id, link, extra_data in short_links.filter(
+            campaign_link__isnull=False
+        ).values_list(
+            'id', 'campaign_link__link', 'campaign_link__extra_data'
+        )
+    }
+
+
+def resolve_short_link(code):
+    """
+        resolve short link code to it's campaign link url, in process LRU first then shared cache,
+        database is read only on a miss of both
+
+    :param code: encoded short link id
+    :return: (short link id, redirect url), redirect url is None for unknown codes
+    """
+    try:
+        short_link_id = url_encoder.decode_id(code)
+    except EncoderError:
+        return None, None
+
+    key = _cache_key(short_link_id)
+    url = _local_cache.get(key)
+    if url is None:
+        url = cache.get(key)
+        if url is None:
+            url = _load_redirects(ShortLink.objects.filter(id=short_link_id)).get(short_link_id, MISSING_REDIRECT)
+            cache.set(key, url, settings.SHORT_LINK_CACHE_TIMEOUT)
+        _local_cache.set(key, url)
+
+    return short_link_id, url or None
+
+
+def invalidate_short_links(short_links_ids):
+    """
+        drop cached redirects of short links, other processes LRU expire in SHORT_LINK_LOCAL_CACHE_TIMEOUT
+
+    :param short_links_ids:
+    :return:
+    """
+    keys = [_cache_key(short_link_id) for short_link_id in short_links_ids]
+    cache.delete_many(keys)
+    _local_cache.delete_many(keys)
+
+
+def warm_campaign_short_links(campaign_id):
+    """
+        put redirects of all campaign short links in shared cache with one query
+
+    :param campaign_id:
+    :return: number of warmed short links
+    """
+    redirects = _load_redirects(ShortLink.objects.filter(campaign_link__campaign_content__campaign_id=campaign_id))
+    cache.set_many(
+        {_cache_key(short_link_id): url for short_link_id, url in redirects.items()},
+        settings.SHORT_LINK_CACHE_TIMEOUT
+    )
+    return len(redirects)
@@ -0,0 +1,80 @@
+import timeit
+
+import numpy as np
+
+from django.core.management import BaseCommand, CommandError
+
+from apps.utils.url_encoder import UrlEncoder
+
+
+class BitLoopUrlEncoder(UrlEncoder):
+    """
+        previous UrlEncoder implementation, bit by bit shuffle, recursive enbase and alphabet.index debase
+    """
+
+    def _encode(self, n):
+        result = 0
+        for i, b in enumerate(self.mapping):
+            if n & (1 << i):
+                result |= (1 << b)
+        return result
+
+    def _decode(self, n):
+        result = 0
+        for i, b in enumerate(self.mapping):
+            if n & (1 << b):
+                result |= (1 << i)
+        return result
+
+    def _enbase(self, x):
+        n = len(self.alphabet)
+        if x < n:
+            return self.alphabet[x]
+        return self._enbase(x // n) + self.alphabet[x % n]
+
+    def debase(self, x):
+        n = len(self.alphabet)
+        result = 0
+        for i, c in enumerate(reversed(x)):
+            result += self.alphabet.index(c) * (n ** i)
+        return result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark UrlEncoder against previous bit loop implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', dest='ids', type=int, default=100000,
+                            help='number of random ids')
+        parser.add_argument('--max-id', dest='max_id', type=int, default=10 ** 9)
+        parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                            help='number of runs per case')
+        parser.add_argument('--seed', dest='seed', type=int, default=0)
+
+    def _timeit(self, func, repeat):
+        return min(timeit.repeat(func, number=1, repeat=repeat))
+
+    def handle(self, *args, **options):
+        ids = np.random.RandomState(options['seed']).randint(0, options['max_id'], size=options['ids'])
+        ids_list = ids.tolist()
+        legacy, encoder = BitLoopUrlEncoder(), UrlEncoder()
+
+        encoded = [legacy.encode_id(i) for i in ids_list]
+        if [encoder.encode_id(i) for i in ids_list] != encoded or encoder.encode_many(ids) != encoded:
+            raise CommandError('encoded values are not compatible with bit loop encoder')
+        if encoder.decode_many(encoded).tolist() != ids_list:
+            raise CommandError('decoded values are not compatible with bit loop encoder')
+
+        cases = [
+            ('encode bit loop', lambda: [legacy.encode_id(i) for i in ids_list]),
+            ('encode table', lambda: [encoder.encode_id(i) for i in ids_list]),
+            ('encode_many', lambda: encoder.encode_many(ids)),
+            ('decode bit loop', lambda: [legacy.decode_id(x) for x in encoded]),
+            ('decode table', lambda: [encoder.decode_id(x) for x in encoded]),
+            ('decode_many', lambda: encoder.decode_many(encoded)),
+        ]
+        for name, func in cases:
+            seconds = self._timeit(func, options['repeat'])
+            self.stdout.write(
+                f"{name:<16} {seconds * 1000:>9.2f} ms  {seconds * 10 ** 9 / len(ids_list):>8.0f} ns/id"
+            )
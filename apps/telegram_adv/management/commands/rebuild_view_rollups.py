@@ -0,0 +1,31 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from apps.telegram_adv.models import CampaignPost
+from apps.telegram_adv.rollups import save_post_views, backfill_last_banner_views
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild CampaignPost last banner views and CampaignPost, CampaignContent views rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaign',
+                            dest='campaign_id',
+                            type=int,
+                            help='only rebuild this campaign rollups')
+
+    def handle(self, *args, **options):
+        posts = CampaignPost.objects.order_by('id')
+        if options['campaign_id']:
+            posts = posts.filter(campaign_content__campaign_id=options['campaign_id'])
+
+        backfill_last_banner_views(posts)
+
+        for campaign_post in posts.iterator():
+            try:
+                save_post_views(campaign_post)
+            except Exception as e:
+                logger.exception(msg=f'rebuild views rollup of post: {campaign_post.id} failed, error: {e}')
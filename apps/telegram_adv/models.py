@@ -8,12 +8,15 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils.safestring import mark_safe
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db.models import Case, When, F, IntegerField, Max, Sum
+from django.db.models import F, Sum
 
 from apps.utils.url_encoder import UrlEncoder
 
 url_encoder = UrlEncoder()
 
+# tariff is price of this many views
+TARIFF_VIEWS_UNIT = 1000
+
 
 class LiveManager(models.Manager):
     def get_queryset(self):
@@ -69,9 +72,17 @@ class Campaign(models.Model):
         db_table = "campaigns"
         ordering = ['-id']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # deferred status is not loaded just for change tracking
+        self._b_status = self.__dict__.get('status')
+
     def __str__(self):
         return f'c_{self.id} - {self.title}'
 
+    def has_status_changed_to_approved(self):
+        return self.status == self.STATUS_APPROVED and self._b_status != self.STATUS_APPROVED
+
     def url_encode(self):
         return url_encoder.encode_id(self.id)
 
@@ -82,19 +93,15 @@ class Campaign(models.Model):
             1 - their views field if is not null
             2 - else last CampaignPostLog of that CampaignPost views
 
+        read from CampaignContentViews rollup
+
         :return: list of Content name and it's views
         """
         return list(self.contents.filter(
             view_type=CampaignContent.TYPE_VIEW_TOTAL,
-            campaignpost__is_enable=True,
+            view_rollup__posts_count__gt=0,
         ).annotate(
-            views=Max(
-                Case(
-                    When(campaignpost__views__isnull=False, then=F("campaignpost__views")),
-                    output_field=IntegerField(),
-                    default=F("campaignpost__logs__banner_views"),
-                ), output_field=IntegerField()
-            )
+            views=F('view_rollup__max_views')
         ).values("id", "display_text", "views"))
 
     def partial_contents_views(self):
@@ -106,48 +113,37 @@ class Campaign(models.Model):
             then:
                 Sum views together
 
+        read from CampaignContentViews rollup
+
         :return: list of Content name and it's views
         """
+        return list(self.contents.filter(
+            view_type=CampaignContent.TYPE_VIEW_PARTIAL,
+            view_rollup__posts_count__gt=0,
+        ).annotate(
+            views=F('view_rollup__sum_views')
+        ).values("id", "display_text", "views"))
 
-        campaign_contents_info = {
-            x['id']: dict(text=x['display_text'], views=x['views'])
-            for x in self.contents.filter(
-                view_type=CampaignContent.TYPE_VIEW_PARTIAL,
-                campaignpost__is_enable=True,
-                campaignpost__views__isnull=False,
-            ).annotate(
-                views=Sum("campaignpost__views")
-            ).values("id", "display_text", "views")
-        }
-
-        for cp in CampaignPost.objects.select_related('campaign_content').filter(
-                campaign_content__campaign=self,
-                campaign_content__view_type=CampaignContent.TYPE_VIEW_PARTIAL,
-                is_enable=True,
-                views__isnull=True,
-        ):
-            views = getattr(cp.logs.last(), 'banner_views', 0)
-            cc = cp.campaign_content
-            if cc.id in campaign_contents_info:
-                campaign_contents_info[cc.id]['views'] += views
-            else:
-                campaign_contents_info[cc.id] = dict(id=cc.id, display_text=cc.display_text, views=views)
-
-        return list(campaign_contents_info.values())
-
-    def shortlink_views(self):
-        links = list(
-            self.contents.filter(
-                links__isnull=False
-            ).prefetch_related(
-                "links__short_links__logs"
-            ).values(
-                'id', 'display_text'
-            ).annotate(
-                ip_count=Sum('links__short_links__logs__ip_count'),
-                hit_count=Sum('links__short_links__logs__hit_count')
-            )
-        )
+    def shortlink_views(self, start=None, end=None):
+        """
+        contents with link ip_count and hit_count, read from ShortLinkHourlyViews buckets
+        plus not compacted ShortLinkLogs, unique_ips is estimated from hourly ip sketches in [start, end)
+
+        :param start: datetime, optional
+        :param end: datetime, optional
+        :return: list of Content name and it's short links views
+        """
+        from .shortlink_stats import get_contents_short_link_views, get_contents_unique_ips
+
+        views = get_contents_short_link_views(self.id)
+        unique_ips = get_contents_unique_ips(self.id, start, end)
+        links = []
+        for content in self.contents.filter(
+            links__isnull=False
+        ).order_by('id').values('id', 'display_text').distinct():
+            content['ip_count'], content['hit_count'] = views.get(content['id'], (None, None))
+            content['unique_ips'] = unique_ips.get(content['id'])
+            links.append(content)
         return links
 
     @property
@@ -241,6 +237,22 @@ class CampaignUser(models.Model):
     def paid(self):
         return bool(self.receipt_date)
 
+    @property
+    def tariff(self):
+        """
+            sum of campaign tariffs of user's channels
+        """
+        return Campaign.publishers.through.objects.filter(
+            campaign_id=self.campaign_id,
+            publisher__in=self.channels.all()
+        ).aggregate(tariff=Sum('tariff'))['tariff'] or 0
+
+    def calculate_price(self):
+        """
+            sum of enabled posts prices, bulk version is apps.telegram_adv.pricing.get_campaign_users_prices
+        """
+        return sum(campaign_post.calculate_price() for campaign_post in self.campaignpost_set.filter(is_enable=True))
+
 
 class CampaignPost(models.Model):
     def shot_directory_path(self, filename):
@@ -257,6 +269,20 @@ class CampaignPost(models.Model):
     class Meta:
         db_table = "campaigns_posts"
 
+    def calculate_price(self):
+        """
+            partial post price: views * user tariff // TARIFF_VIEWS_UNIT,
+            views is views field if is not null else last CampaignPostLog banner views,
+            bulk version is apps.telegram_adv.pricing.get_campaign_posts_prices
+        """
+        if self.campaign_content.view_type != CampaignContent.TYPE_VIEW_PARTIAL:
+            return 0
+
+        views = self.views
+        if views is None:
+            views = getattr(getattr(self, 'view_rollup', None), 'last_banner_views', None)
+        return (views or 0) * self.campaign_user.tariff // TARIFF_VIEWS_UNIT
+
     def _screen_preview(self):
         if not self.screen_shot:
             return '-'
@@ -273,3 +299,84 @@ class CampaignPost(models.Model):
             )
 
 
+class CampaignPostViews(models.Model):
+    """
+        current views of a CampaignPost, views field if is not null else last CampaignPostLog banner views
+        kept by apps.telegram_adv.rollups, last_banner_views is written only by CampaignPostLog writer
+    """
+    updated_time = models.DateTimeField(_('updated time'), auto_now=True)
+    views = models.PositiveIntegerField(_('views'), default=0)
+    last_banner_views = models.PositiveIntegerField(_('last banner views'), null=True, blank=True)
+    is_enable = models.BooleanField(_('is enable'), default=True)
+
+    campaign_post = models.OneToOneField(CampaignPost, on_delete=models.CASCADE, related_name="view_rollup")
+    campaign_content = models.ForeignKey(CampaignContent, on_delete=models.CASCADE, related_name="post_view_rollups")
+
+    class Meta:
+        db_table = "campaigns_posts_views"
+        index_together = [('campaign_content', 'is_enable')]
+
+
+class CampaignContentViews(models.Model):
+    """
+        enabled CampaignPosts views rollup of a CampaignContent
+            * max_views: total view type contents report
+            * sum_views: partial view type contents report
+    """
+    updated_time = models.DateTimeField(_('updated time'), auto_now=True)
+    posts_count = models.PositiveIntegerField(_('posts count'), default=0)
+    max_views = models.PositiveIntegerField(_('max views'), default=0)
+    sum_views = models.PositiveIntegerField(_('sum views'), default=0)
+
+    campaign_content = models.OneToOneField(CampaignContent, on_delete=models.CASCADE, related_name="view_rollup")
+
+    class Meta:
+        db_table = "campaigns_contents_views"
+
+
+class CampaignReportSnapshot(models.Model):
+    """
+        rendered advertiser report of a campaign, version is campaign report version at render time
+        (see apps.telegram_adv.reports)
+    """
+    updated_time = models.DateTimeField(_('updated time'), auto_now=True)
+    version = models.BigIntegerField(_('version'), default=0)
+    data = JSONField(_('data'), default=dict, editable=False)
+
+    campaign = models.OneToOneField(Campaign, on_delete=models.CASCADE, related_name="report_snapshot")
+
+    class Meta:
+        db_table = "campaigns_report_snapshots"
+
+
+class RollupCursor(models.Model):
+    """
+        last compacted row id of an append only log table
+    """
+    updated_time = models.DateTimeField(_('updated time'), auto_now=True)
+    name = models.CharField(_('name'), max_length=64, unique=True)
+    position = models.BigIntegerField(_('position'), default=0)
+
+    class Meta:
+        db_table = "rollup_cursors"
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class ShortLinkHourlyViews(models.Model):
+    """
+        hourly rollup of ShortLinkLog per CampaignLink, kept by compaction task
+    """
+    hour = models.DateTimeField(_('hour'))
+    hit_count = models.PositiveIntegerField(_('hit count'), default=0)
+    ip_count = models.PositiveIntegerField(_('ip count'), default=0)
+    # HyperLogLog registers of visitors ips, see apps.utils.hyperloglog
+    ip_sketch = models.BinaryField(_('ip sketch'), default=bytes, editable=False)
+
+    campaign_link = models.ForeignKey("CampaignLink", on_delete=models.CASCADE, related_name="hourly_views")
+    campaign_content = models.ForeignKey(CampaignContent, on_delete=models.CASCADE, related_name="link_hourly_views")
+
+    class Meta:
+        db_table = "campaigns_links_hourly_views"
+        unique_together = [('campaign_link', 'hour')]
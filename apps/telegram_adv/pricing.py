@@ -0,0 +1,97 @@
+import numpy as np
+
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import CampaignContent, CampaignUser, CampaignPost, CampaignPublisher, TARIFF_VIEWS_UNIT
+
+# bulk prices and tariffs are equal to CampaignPost.calculate_price(), CampaignUser.calculate_price()
+# and CampaignUser.tariff (CampaignUserPriceTestCase)
+
+
+def _users_tariffs(campaign_id, campaign_user_id):
+    """
+        subquery of campaign user tariff, same as CampaignUser.tariff
+    """
+    return Subquery(CampaignPublisher.objects.filter(
+        campaign_id=campaign_id,
+        publisher__campaignuser=campaign_user_id
+    ).order_by().values('campaign_id').annotate(total=Sum('tariff')).values('total'))
+
+
+def _posts_prices(campaign_posts):
+    """
+        price of posts with one query: views * tariff // TARIFF_VIEWS_UNIT for partial posts else 0,
+        views is last CampaignPostLog banner views if views is not set and
+        tariff is sum of CampaignPublisher tariffs of post user's channels in campaign
+
+    :param campaign_posts: CampaignPost queryset
+    :return: arrays of posts ids, campaign users ids and prices
+    """
+    rows = list(campaign_posts.annotate(
+        tariff=_users_tariffs(OuterRef('campaign_user__campaign_id'), OuterRef('campaign_user_id')),
+        post_views=Coalesce('views', 'view_rollup__last_banner_views')
+    ).values_list(
+        'id', 'campaign_user_id', 'post_views', 'tariff', 'campaign_content__view_type'
+    ))
+    if not rows:
+        empty = np.asarray([], dtype=np.int64)
+        return empty, empty, empty
+
+    posts_ids, users_ids, views, tariff, view_types = zip(*rows)
+    views = np.asarray([v or 0 for v in views], dtype=np.int64)
+    tariff = np.asarray([t or 0 for t in tariff], dtype=np.int64)
+    partial = np.asarray(view_types) == CampaignContent.TYPE_VIEW_PARTIAL
+
+    prices = np.where(partial, views * tariff // TARIFF_VIEWS_UNIT, 0)
+    return np.asarray(posts_ids, dtype=np.int64), np.asarray(users_ids, dtype=np.int64), prices
+
+
+def get_campaign_posts_prices(campaign_posts_ids):
+    """
+        price of many posts with one query
+
+    :param campaign_posts_ids:
+    :return: dict of campaign post id and it's price
+    """
+    posts_ids, _, prices = _posts_prices(CampaignPost.objects.filter(id__in=campaign_posts_ids))
+    return dict(zip(posts_ids.tolist(), prices.tolist()))
+
+
+def get_campaign_users_prices(campaign_users_ids):
+    """
+        price of many campaign users with one query:
+        sum of enabled posts prices
+
+    :param campaign_users_ids:
+    :return: dict of campaign user id and it's price, users without priced posts get 0
+    """
+    _, users_ids, posts_prices = _posts_prices(CampaignPost.objects.filter(
+        campaign_user_id__in=campaign_users_ids,
+        is_enable=True
+    ))
+
+    prices = dict.fromkeys(campaign_users_ids, 0)
+    unique_users_ids, users_index = np.unique(users_ids, return_inverse=True)
+    users_prices = np.bincount(users_index, weights=posts_prices, minlength=unique_users_ids.size)
+    prices.update(zip(unique_users_ids.tolist(), users_prices.astype(np.int64).tolist()))
+    return prices
+
+
+def get_campaign_users_tariffs(campaign_users_ids):
+    """
+        tariff of many campaign users with one query
+
+    :param campaign_users_ids:
+    :return: dict of campaign user id and it's tariff
+    """
+    return {
+        campaign_user_id: tariff or 0
+        for campaign_user_id, tariff in CampaignUser.objects.filter(
+            id__in=campaign_users_ids
+        ).annotate(
+            users_tariff=_users_tariffs(OuterRef('campaign_id'), OuterRef('pk'))
+        ).values_list(
+            'id', 'users_tariff'
+        )
+    }
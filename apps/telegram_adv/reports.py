@@ -0,0 +1,166 @@
+import json
+import hashlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+from django.core.cache import cache
+from django.db.models.functions import Coalesce
+
+from apps.utils.cache_version import get_cache_version, bump_cache_version
+
+from .models import Campaign, CampaignContent, CampaignReportSnapshot
+
+CampaignReport = namedtuple('CampaignReport', ['etag', 'data'])
+
+
+def _report_version_key(campaign_id):
+    return f'campaign_report_version_{campaign_id}'
+
+
+def get_report_version(campaign_id):
+    return get_cache_version(_report_version_key(campaign_id))
+
+
+def invalidate_campaign_report(campaign_id):
+    """
+        campaign contents views changed, next report read rebuilds it
+    """
+    bump_cache_version(_report_version_key(campaign_id))
+    schedule_report_snapshot(campaign_id)
+
+
+def build_campaign_report(campaign_id):
+    """
+        partial contents views of campaign with one query on CampaignContentViews rollup
+
+    :param campaign_id:
+    :return: CampaignReport, etag is hash of report data
+    """
+    data = [
+        {'content': content_id, 'views': views}
+        for content_id, views in CampaignContent.objects.filter(
+            campaign_id=campaign_id,
+            view_type=CampaignContent.TYPE_VIEW_PARTIAL
+        ).annotate(
+            views=Coalesce('view_rollup__sum_views', 0)
+        ).order_by(
+            'id'
+        ).values_list(
+            'id', 'views'
+        )
+    ]
+
+    etag = hashlib.md5(json.dumps(data).encode()).hexdigest()
+    return CampaignReport(etag=etag, data=data)
+
+
+def get_campaign_report(campaign_id):
+    """
+        campaign report cached until campaign contents views change (see invalidate_campaign_report)
+
+    :param campaign_id:
+    :return: CampaignReport
+    """
+    # reports cached with last_modified had another shape and key
+    key = f'campaign_etag_report_{campaign_id}_{get_report_version(campaign_id)}'
+    report = cache.get(key)
+    if report is None:
+        report = build_campaign_report(campaign_id)
+        cache.set(key, tuple(report), settings.CAMPAIGN_REPORT_CACHE_TIMEOUT)
+    return CampaignReport(*report)
+
+
+def _snapshot_lock_key(campaign_id):
+    return f'campaign_report_snapshot_lock_{campaign_id}'
+
+
+def schedule_report_snapshot(campaign_id):
+    """
+        render campaign report snapshot after CAMPAIGN_REPORT_SNAPSHOT_DELAY seconds,
+        views logged in the meantime are rendered by the same task
+    """
+    if cache.add(f'campaign_report_snapshot_scheduled_{campaign_id}', 1, settings.CAMPAIGN_REPORT_SNAPSHOT_DELAY):
+        from .tasks import refresh_campaign_report_snapshot
+        refresh_campaign_report_snapshot.apply_async(
+            args=[campaign_id],
+            countdown=settings.CAMPAIGN_REPORT_SNAPSHOT_DELAY
+        )
+
+
+def render_report_snapshot(campaign_id):
+    """
+        render total, partial and shortlink views of campaign and store them as it's snapshot
+
+    :param campaign_id:
+    :return: CampaignReportSnapshot
+    """
+    # version is read before render so views logged during render keep the snapshot stale
+    version = get_report_version(campaign_id)
+    campaign = Campaign.objects.get(id=campaign_id)
+    snapshot, _ = CampaignReportSnapshot.objects.update_or_create(
+        campaign_id=campaign_id,
+        defaults=dict(
+            version=version,
+            data=dict(
+                total=campaign.total_contents_views(),
+                partial=campaign.partial_contents_views(),
+                shortlink=campaign.shortlink_views()
+            )
+        )
+    )
+    return snapshot
+
+
+def is_snapshot_stale(snapshot):
+    """
+        stale when views changed after render or snapshot is older than CAMPAIGN_REPORT_SNAPSHOT_MAX_AGE,
+        short link views don't change report version and are refreshed by age
+    """
+    max_age = timezone.timedelta(seconds=settings.CAMPAIGN_REPORT_SNAPSHOT_MAX_AGE)
+    return (
+        snapshot.version != get_report_version(snapshot.campaign_id) or
+        snapshot.updated_time < timezone.now() - max_age
+    )
+
+
+def refresh_report_snapshot(campaign_id, force=False):
+    """
+        render campaign snapshot if it's stale, one render per campaign at a time
+
+    :param campaign_id:
+    :param force: render even if snapshot is fresh
+    :return: rendered CampaignReportSnapshot, None if snapshot is fresh or another render is running
+    """
+    if not force:
+        snapshot = CampaignReportSnapshot.objects.filter(campaign_id=campaign_id).first()
+        if snapshot is not None and not is_snapshot_stale(snapshot):
+            return None
+
+    lock_key = _snapshot_lock_key(campaign_id)
+    if not cache.add(lock_key, 1, settings.CAMPAIGN_REPORT_SNAPSHOT_LOCK_TIMEOUT):
+        return None
+
+    try:
+        return render_report_snapshot(campaign_id)
+    finally:
+        cache.delete(lock_key)
+
+
+def get_report_snapshot(campaign_id):
+    """
+        advertiser report of campaign served from it's snapshot, a stale snapshot is served as is
+        and rendered again in background, only first snapshot of campaign is rendered in request
+        by the request which holds render lock
+
+    :param campaign_id:
+    :return: report data, None if first snapshot is being rendered by another request
+    """
+    snapshot = CampaignReportSnapshot.objects.filter(campaign_id=campaign_id).first()
+    if snapshot is not None:
+        if is_snapshot_stale(snapshot):
+            schedule_report_snapshot(campaign_id)
+        return snapshot.data
+
+    rendered = refresh_report_snapshot(campaign_id, force=True)
+    return rendered.data if rendered is not None else None
@@ -0,0 +1,186 @@
+from django.utils import timezone
+from django.db.models import Count, Max, Sum, F, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import CampaignPost, CampaignPostLog, CampaignPostViews, CampaignContent, CampaignContentViews
+from .counters import record_views
+from .reports import invalidate_campaign_report
+
+
+def _content(campaign_content_id):
+    return CampaignContent.objects.filter(
+        id=campaign_content_id
+    ).values(
+        'id', 'campaign_id', 'view_type', 'campaign__max_view'
+    ).first()
+
+
+def refresh_content_views(campaign_content_id):
+    """
+        re-aggregate CampaignContent rollup from its posts rollup rows (no logs join),
+        used when deltas can't keep it (post deleted, max views decreased)
+
+    :param campaign_content_id:
+    :return:
+    """
+    rollup = CampaignPostViews.objects.filter(
+        campaign_content_id=campaign_content_id,
+        is_enable=True
+    ).aggregate(
+        posts_count=Count('id'),
+        max_views=Coalesce(Max('views'), 0),
+        sum_views=Coalesce(Sum('views'), 0),
+    )
+    CampaignContentViews.objects.update_or_create(
+        campaign_content_id=campaign_content_id,
+        defaults=rollup
+    )
+    campaign_id = CampaignContent.objects.filter(id=campaign_content_id).values_list('campaign_id', flat=True).first()
+    if campaign_id is not None:
+        invalidate_campaign_report(campaign_id)
+
+
+def add_content_views(content, posts_count, sum_views, views):
+    """
+        apply a post change to CampaignContent rollup with one update query
+
+    :param content: CampaignContent values of _content()
+    :param posts_count: enabled posts difference
+    :param sum_views: views difference
+    :param views: current views of the post if enabled else 0, may raise max_views
+    :return:
+    """
+    updated = CampaignContentViews.objects.filter(
+        campaign_content_id=content['id']
+    ).update(
+        posts_count=F('posts_count') + posts_count,
+        sum_views=F('sum_views') + sum_views,
+        max_views=Greatest('max_views', Value(views)),
+        updated_time=timezone.now()
+    )
+    if not updated:
+        refresh_content_views(content['id'])
+    else:
+        invalidate_campaign_report(content['campaign_id'])
+
+
+def update_post_views(campaign_post_id, content, views, is_enable, last_banner_views=None):
+    """
+        set current views of a CampaignPost, add the difference to it's content rollup
+        and real time counters (see apps.telegram_adv.counters)
+
+    :param campaign_post_id:
+    :param content: CampaignContent values of _content()
+    :param views: CampaignPost views field, None to use last banner views
+    :param is_enable:
+    :param last_banner_views: banner views of a new CampaignPostLog, only log writer sets it
+    :return:
+    """
+    old = CampaignPostViews.objects.filter(
+        campaign_post_id=campaign_post_id
+    ).values(
+        'campaign_content_id', 'views', 'is_enable', 'last_banner_views'
+    ).first()
+
+    rollup = dict(campaign_content_id=content['id'], is_enable=is_enable)
+    if last_banner_views is not None:
+        rollup['last_banner_views'] = last_banner_views
+    elif old is not None:
+        last_banner_views = old['last_banner_views']
+    rollup['views'] = views = (views if views is not None else last_banner_views) or 0
+
+    if old is None:
+        CampaignPostViews.objects.create(campaign_post_id=campaign_post_id, **rollup)
+    else:
+        CampaignPostViews.objects.filter(
+            campaign_post_id=campaign_post_id
+        ).update(
+            updated_time=timezone.now(), **rollup
+        )
+
+    if old is not None and old['campaign_content_id'] != content['id']:
+        # post moved to another content, old content is re-aggregated and post is new for this content
+        refresh_content_views(old['campaign_content_id'])
+        old = None
+
+    old_enable = bool(old and old['is_enable'])
+    old_views = old['views'] if old_enable else 0
+    new_views = views if is_enable else 0
+    if new_views < old_views:
+        # max_views can't be decreased by a delta
+        refresh_content_views(content['id'])
+    elif new_views > old_views or is_enable != old_enable:
+        add_content_views(
+            content,
+            posts_count=int(is_enable) - int(old_enable),
+            sum_views=new_views - old_views,
+            views=new_views
+        )
+
+    record_views(content, new_views - old_views)
+
+
+def log_post_views(campaign_post_id, banner_views):
+    """
+        new CampaignPostLog written, keep it's banner views on post rollup then
+        posts with filled views field don't read logs
+    """
+    post = CampaignPost.objects.filter(
+        id=campaign_post_id
+    ).values(
+        'campaign_content_id', 'views', 'is_enable',
+        'campaign_content__campaign_id', 'campaign_content__view_type', 'campaign_content__campaign__max_view'
+    ).first()
+    if post is None:
+        return
+
+    content = {
+        'id': post['campaign_content_id'],
+        'campaign_id': post['campaign_content__campaign_id'],
+        'view_type': post['campaign_content__view_type'],
+        'campaign__max_view': post['campaign_content__campaign__max_view'],
+    }
+    update_post_views(campaign_post_id, content, post['views'], post['is_enable'], last_banner_views=banner_views)
+
+
+def save_post_views(campaign_post):
+    """
+        CampaignPost saved, views or is_enable may changed,
+        posts without views keep last banner views of their rollup
+    """
+    content = _content(campaign_post.campaign_content_id)
+    if content is not None:
+        update_post_views(campaign_post.id, content, campaign_post.views, campaign_post.is_enable)
+
+
+def backfill_last_banner_views(campaign_posts):
+    """
+        set last banner views of given posts rollup from their latest CampaignPostLog in one update query,
+        missing rollup rows are created disabled so next save_post_views adds their views
+
+    :param campaign_posts: CampaignPost queryset
+    :return: number of updated posts
+    """
+    CampaignPostViews.objects.bulk_create(
+        [
+            CampaignPostViews(campaign_post_id=post_id, campaign_content_id=content_id, is_enable=False)
+            for post_id, content_id in campaign_posts.filter(
+                view_rollup__isnull=True
+            ).values_list(
+                'id', 'campaign_content_id'
+            )
+        ],
+        batch_size=1000
+    )
+
+    latest_log_views = CampaignPostLog.objects.filter(
+        campaign_post=OuterRef('campaign_post_id')
+    ).order_by(
+        '-id'
+    ).values('banner_views')[:1]
+
+    return CampaignPostViews.objects.filter(
+        campaign_post__in=campaign_posts.values('id')
+    ).update(
+        last_banner_views=Subquery(latest_log_views)
+    )
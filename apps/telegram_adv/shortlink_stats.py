@@ -0,0 +1,193 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from apps.utils.hyperloglog import HyperLogLog
+
+from .models import ShortLink, ShortLinkLog, ShortLinkHourlyViews, RollupCursor
+
+SHORT_LINK_LOGS_CURSOR = 'short_link_logs'
+
+
+def get_short_link_logs_cursor():
+    return RollupCursor.objects.filter(
+        name=SHORT_LINK_LOGS_CURSOR
+    ).values_list(
+        'position', flat=True
+    ).first() or 0
+
+
+def compact_short_link_logs():
+    """
+        add ShortLinkLogs after cursor to ShortLinkHourlyViews buckets then move cursor,
+        ShortLinkLog is append only so every log is compacted once,
+        logs younger than SHORT_LINK_LOGS_COMPACT_LAG_MINUTE are left for next run so rows of
+        transactions which are not committed yet (lower ids) are not passed by cursor
+
+    :return: number of touched hourly buckets
+    """
+    with transaction.atomic():
+        cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=SHORT_LINK_LOGS_CURSOR)
+        safe_time = timezone.now() - timezone.timedelta(minutes=settings.SHORT_LINK_LOGS_COMPACT_LAG_MINUTE)
+        pending_logs = ShortLinkLog.objects.filter(id__gt=cursor.position)
+        # stop before first young log, flushed logs have bucket time so ids are not ordered by created_time
+        first_young_id = pending_logs.filter(created_time__gte=safe_time).aggregate(first_id=Min('id'))['first_id']
+        if first_young_id is not None:
+            pending_logs = pending_logs.filter(id__lt=first_young_id)
+        last_log_id = pending_logs.filter(created_time__lt=safe_time).aggregate(last_id=Max('id'))['last_id'] or 0
+        if last_log_id <= cursor.position:
+            return 0
+
+        buckets = ShortLinkLog.objects.filter(
+            id__gt=cursor.position,
+            id__lte=last_log_id,
+            short_link__campaign_link__isnull=False
+        ).annotate(
+            hour=TruncHour('created_time')
+        ).order_by().values(
+            'short_link__campaign_link_id', 'short_link__campaign_link__campaign_content_id', 'hour'
+        ).annotate(
+            hits=Sum('hit_count'),
+            ips=Sum('ip_count')
+        )
+        buckets = {
+            (bucket['short_link__campaign_link_id'], bucket['hour']): bucket
+            for bucket in buckets
+        }
+
+        existing = {
+            (hourly.campaign_link_id, hourly.hour): hourly
+            for hourly in ShortLinkHourlyViews.objects.filter(
+                campaign_link_id__in={link_id for link_id, _ in buckets},
+                hour__in={hour for _, hour in buckets}
+            )
+        }
+
+        updated, created = [], []
+        for key, bucket in buckets.items():
+            hourly = existing.get(key)
+            if hourly is None:
+                created.append(ShortLinkHourlyViews(
+                    campaign_link_id=key[0],
+                    campaign_content_id=bucket['short_link__campaign_link__campaign_content_id'],
+                    hour=key[1],
+                    hit_count=bucket['hits'] or 0,
+                    ip_count=bucket['ips'] or 0
+                ))
+            else:
+                hourly.hit_count += bucket['hits'] or 0
+                hourly.ip_count += bucket['ips'] or 0
+                updated.append(hourly)
+
+        ShortLinkHourlyViews.objects.bulk_create(created)
+        ShortLinkHourlyViews.objects.bulk_update(updated, fields=['hit_count', 'ip_count'])
+
+        cursor.position = last_log_id
+        cursor.save(update_fields=['updated_time', 'position'])
+
+    return len(buckets)
+
+
+def merge_ip_sketches(hour, sketches):
+    """
+        merge short links ips HyperLogLog sketches of an hour into ShortLinkHourlyViews buckets,
+        missing buckets are created with zero counts and compaction adds counts later
+
+    :param hour: datetime truncated to hour
+    :param sketches: dict of short link id and it's HyperLogLog
+    :return:
+    """
+    links_sketches = {}
+    for short_link_id, campaign_link_id, campaign_content_id in ShortLink.objects.filter(
+        id__in=list(sketches),
+        campaign_link__isnull=False
+    ).values_list(
+        'id', 'campaign_link_id', 'campaign_link__campaign_content_id'
+    ):
+        sketch, _ = links_sketches.setdefault(campaign_link_id, (HyperLogLog(), campaign_content_id))
+        sketch.merge(sketches[short_link_id])
+
+    if not links_sketches:
+        return
+
+    # cursor lock serializes buckets creation with compact_short_link_logs
+    with transaction.atomic():
+        RollupCursor.objects.select_for_update().get_or_create(name=SHORT_LINK_LOGS_CURSOR)
+        updated = []
+        for hourly in ShortLinkHourlyViews.objects.filter(campaign_link_id__in=list(links_sketches), hour=hour):
+            sketch, _ = links_sketches.pop(hourly.campaign_link_id)
+            hourly.ip_sketch = HyperLogLog.from_bytes(hourly.ip_sketch).merge(sketch).to_bytes()
+            updated.append(hourly)
+
+        ShortLinkHourlyViews.objects.bulk_update(updated, fields=['ip_sketch'])
+        ShortLinkHourlyViews.objects.bulk_create([
+            ShortLinkHourlyViews(
+                campaign_link_id=campaign_link_id,
+                campaign_content_id=campaign_content_id,
+                hour=hour,
+                ip_sketch=sketch.to_bytes()
+            )
+            for campaign_link_id, (sketch, campaign_content_id) in links_sketches.items()
+        ])
+
+
+def get_contents_unique_ips(campaign_id, start=None, end=None):
+    """
+        estimate distinct visitors ips per campaign content in [start, end) hours by merging
+        hourly HyperLogLog sketches, memory is constant per content whatever the range is
+
+    :param campaign_id:
+    :param start: datetime, optional
+    :param end: datetime, optional
+    :return: dict of content id and it's estimated unique ips
+    """
+    hourly_views = ShortLinkHourlyViews.objects.filter(campaign_content__campaign_id=campaign_id)
+    if start is not None:
+        hourly_views = hourly_views.filter(hour__gte=start)
+    if end is not None:
+        hourly_views = hourly_views.filter(hour__lt=end)
+
+    sketches = {}
+    for content_id, ip_sketch in hourly_views.order_by().values_list('campaign_content_id', 'ip_sketch').iterator():
+        sketches.setdefault(content_id, HyperLogLog()).merge(HyperLogLog.from_bytes(ip_sketch))
+
+    return {content_id: sketch.count() for content_id, sketch in sketches.items()}
+
+
+def get_contents_short_link_views(campaign_id):
+    """
+        sum hourly buckets and not compacted logs tail per campaign content
+
+    :param campaign_id:
+    :return: dict of content id and it's (ip_count, hit_count)
+    """
+    views = {}
+    for content_id, ip_count, hit_count in ShortLinkHourlyViews.objects.filter(
+        campaign_content__campaign_id=campaign_id
+    ).order_by().values(
+        'campaign_content_id'
+    ).annotate(
+        ips=Sum('ip_count'),
+        hits=Sum('hit_count')
+    ).values_list(
+        'campaign_content_id', 'ips', 'hits'
+    ):
+        views[content_id] = (ip_count, hit_count)
+
+    for content_id, ip_count, hit_count in ShortLinkLog.objects.filter(
+        id__gt=get_short_link_logs_cursor(),
+        short_link__campaign_link__campaign_content__campaign_id=campaign_id
+    ).order_by().values(
+        'short_link__campaign_link__campaign_content_id'
+    ).annotate(
+        ips=Sum('ip_count'),
+        hits=Sum('hit_count')
+    ).values_list(
+        'short_link__campaign_link__campaign_content_id', 'ips', 'hits'
+    ):
+        compacted_ip_count, compacted_hit_count = views.get(content_id, (0, 0))
+        views[content_id] = (compacted_ip_count + (ip_count or 0), compacted_hit_count + (hit_count or 0))
+
+    return views
@@ -1,9 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db import transaction
 from django.dispatch import receiver
 
 from apps.telegram_bot.tasks import upload_file
-from .models import CampaignUser, CampaignFile
-from .tasks import send_paid_push
+from .models import (
+    Campaign, CampaignUser, CampaignFile, CampaignPost, CampaignPostLog, CampaignLink, ShortLink, CampaignContent
+)
+from .tasks import send_paid_push, warm_campaign_short_links_task
+from .rollups import log_post_views, save_post_views, refresh_content_views
+from .link_resolver import invalidate_short_links
+from .reports import invalidate_campaign_report
 
 
 @receiver(post_save, sender=CampaignFile)
@@ -21,3 +27,49 @@ def paid_push_notification(sender, instance, created, **kwargs):
             instance.campaign.title,
             instance.push_channels_context()
         )
+
+
+@receiver(post_save, sender=CampaignPostLog)
+def campaign_post_log_views(sender, instance, created, **kwargs):
+    if created:
+        log_post_views(instance.campaign_post_id, instance.banner_views)
+
+
+@receiver(post_save, sender=CampaignPost)
+def campaign_post_views(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and not {'views', 'is_enable'}.intersection(update_fields):
+        return
+
+    save_post_views(instance)
+
+
+@receiver(post_delete, sender=CampaignPost)
+def campaign_post_deleted_views(sender, instance, **kwargs):
+    refresh_content_views(instance.campaign_content_id)
+
+
+@receiver(post_save, sender=Campaign)
+def campaign_approved_short_links(sender, instance, created, **kwargs):
+    if instance.has_status_changed_to_approved():
+        instance._b_status = instance.status
+        # inline CampaignLinks of admin form are saved after campaign, warm after commit
+        campaign_id = instance.id
+        transaction.on_commit(lambda: warm_campaign_short_links_task.delay(campaign_id))
+
+
+@receiver(post_save, sender=CampaignLink)
+@receiver(pre_delete, sender=CampaignLink)
+def campaign_link_short_links(sender, instance, **kwargs):
+    invalidate_short_links(ShortLink.objects.filter(campaign_link=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=ShortLink)
+@receiver(post_delete, sender=ShortLink)
+def short_link_changed(sender, instance, **kwargs):
+    invalidate_short_links([instance.id])
+
+
+@receiver(post_save, sender=CampaignContent)
+@receiver(post_delete, sender=CampaignContent)
+def campaign_content_report(sender, instance, **kwargs):
+    invalidate_campaign_report(instance.campaign_id)
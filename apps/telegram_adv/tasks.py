@@ -1,12 +1,20 @@
 import logging
 
 from celery import shared_task
-from telegram import Bot
 
+from django.conf import settings
+from django.utils import timezone
 from django.db.models import Case, When, F, Sum, IntegerField
 
+from apps.utils.telegram_gateway import get_gateway
 from .texts import PAID_PUSH
-from .models import CampaignUser, Campaign, BankAccount, CampaignContent
+from .models import CampaignUser, Campaign, BankAccount, CampaignContent, CampaignContentViews
+from .counters import reconcile_view_counters
+from .shortlink_stats import compact_short_link_logs
+from .hit_buffer import flush_hit_buffer
+from .link_resolver import warm_campaign_short_links
+from .reports import refresh_report_snapshot
+from .pricing import get_campaign_users_prices
 
 logger = logging.getLogger(__name__)
 
@@ -14,11 +22,10 @@ logger = logging.getLogger(__name__)
 @shared_task
 def check_to_calculate_campaign_user(campaign_users_ids):
     """
-        check if admin approve all posts, calculate all banners price and sum
+        check if admin approve all posts, calculate all banners price and sum,
+        prices of all campaign users are computed together (see apps.telegram_adv.pricing)
     """
-    campaign_users = CampaignUser.objects.prefetch_related(
-        'campaignpost_set'
-        ).filter(
+    campaign_users_ids = list(CampaignUser.objects.filter(
         id__in=campaign_users_ids,
         campaign__status__in=[Campaign.STATUS_APPROVED, Campaign.STATUS_CLOSE],
         receipt_date__isnull=True,
@@ -37,17 +44,23 @@ def check_to_calculate_campaign_user(campaign_users_ids):
         )
     ).filter(
         has_tariif_posts=F('approved_posts')
-    )
+    ).values_list('id', flat=True))
 
-    for campaign_user in campaign_users:
-        campaign_user.receipt_price = campaign_user.calculate_price()
-        campaign_user.save(update_fields=['updated_time', 'receipt_price'])
+    now = timezone.now()
+    CampaignUser.objects.bulk_update(
+        [
+            CampaignUser(id=campaign_user_id, receipt_price=price, updated_time=now)
+            for campaign_user_id, price in get_campaign_users_prices(campaign_users_ids).items()
+        ],
+        fields=['updated_time', 'receipt_price'],
+        batch_size=500
+    )
 
 
 @shared_task
 def send_paid_push(chat_id, bot_token, campaign_title, channels_tag):
     try:
-        push_bot = Bot(token=bot_token)
+        push_bot = get_gateway(bot_token)
         push_bot.send_message(chat_id=chat_id, text=PAID_PUSH % (campaign_title, channels_tag), parse_mode="Markdown")
     except Exception as e:
         logger.error(f"send paid push failed user: {chat_id} error: {e}")
@@ -62,21 +75,94 @@ def delete_invalid_campaign_users():
         c.delete()
 
 
+@shared_task
+def reconcile_campaign_view_counters():
+    """
+        reset real time views counters from database rollups
+    """
+    reconcile_view_counters()
+
+
 @shared_task
 def disable_campaign_by_max_view():
     """
         disable campaigns which even one of the contents views achieved max_view
         and don't read banner views until campaign end datetime.
+
+        max partial contents views of all enabled campaigns read from CampaignContentViews rollup
+        then over budget campaigns disable with one update
+
+    :return: disabled campaigns ids
     """
-    campaigns = Campaign.objects.filter(
-        status=Campaign.STATUS_APPROVED,
-        is_enable=True
-    ).only(
-        'max_view'
+    over_budget_campaigns_ids = list(
+        CampaignContentViews.objects.filter(
+            campaign_content__view_type=CampaignContent.TYPE_VIEW_PARTIAL,
+            campaign_content__campaign__status=Campaign.STATUS_APPROVED,
+            campaign_content__campaign__is_enable=True,
+            sum_views__gte=F('campaign_content__campaign__max_view'),
+        ).values_list(
+            'campaign_content__campaign_id', flat=True
+        ).distinct()
     )
 
-    for campaign in campaigns:
-        contents_info = campaign.partial_contents_views()
-        if any([cc['views'] >= campaign.max_view for cc in contents_info]):
-            campaign.is_enable = False
-            campaign.save(update_fields=['updated_time', 'is_enable'])
+    if over_budget_campaigns_ids:
+        Campaign.objects.filter(
+            id__in=over_budget_campaigns_ids,
+            is_enable=True
+        ).update(
+            is_enable=False,
+            updated_time=timezone.now()
+        )
+        logger.info(f"campaigns: {over_budget_campaigns_ids} disabled by max view")
+
+    return over_budget_campaigns_ids
+
+
+@shared_task
+def compact_short_link_logs_task():
+    """
+        compact new ShortLinkLogs into hourly buckets
+    """
+    buckets_count = compact_short_link_logs()
+    logger.info(f"short link logs compacted to {buckets_count} hourly buckets")
+
+
+@shared_task
+def flush_short_link_hit_buffer():
+    """
+        write buffered short link hits as ShortLinkLogs
+    """
+    flush_hit_buffer()
+
+
+@shared_task
+def warm_campaign_short_links_task(campaign_id):
+    """
+        cache redirects of approved campaign short links before clicks arrive
+    """
+    short_links_count = warm_campaign_short_links(campaign_id)
+    logger.info(f"campaign: {campaign_id} warmed {short_links_count} short links redirects")
+
+
+@shared_task
+def refresh_campaign_report_snapshot(campaign_id):
+    """
+        render advertiser report snapshot of campaign if it's stale
+    """
+    refresh_report_snapshot(campaign_id)
+
+
+@shared_task
+def refresh_campaigns_report_snapshots():
+    """
+        render stale advertiser report snapshots of active campaigns
+    """
+    now = timezone.now()
+    campaigns_ids = Campaign.objects.filter(
+        status=Campaign.STATUS_APPROVED,
+        start_datetime__lte=now,
+        end_datetime__gte=now - timezone.timedelta(seconds=settings.CAMPAIGN_REPORT_SNAPSHOT_MAX_AGE)
+    ).values_list('id', flat=True)
+
+    rendered = [campaign_id for campaign_id in campaigns_ids if refresh_report_snapshot(campaign_id)]
+    logger.info(f"campaigns: {rendered} report snapshots rendered")
@@ -1,12 +1,42 @@
+from unittest import mock
+
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from rest_framework.authtoken.models import Token
 
 from django.conf import settings
 from django.urls import reverse
+from django.test import SimpleTestCase, TestCase, RequestFactory
+from django.db import connection, OperationalError
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import lookup_field
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.utils import timezone
 from django.contrib.auth.models import User
 
-from apps.telegram_adv.models import TelegramAgent
+from apps.telegram_adv.models import (
+    TelegramAgent, TelegramChannel, Campaign, CampaignUser, CampaignPost, CampaignPublisher, CampaignContent,
+    CampaignReportSnapshot, CampaignContentViews, CampaignPostViews
+)
+from apps.telegram_adv.counters import record_views, _content_key
+from apps.telegram_adv.rollups import log_post_views
+from apps.telegram_adv.pricing import get_campaign_users_prices, get_campaign_posts_prices, get_campaign_users_tariffs
+from apps.telegram_adv.reports import (
+    get_report_snapshot, invalidate_campaign_report, is_snapshot_stale, render_report_snapshot, _snapshot_lock_key,
+    _report_version_key
+)
+from apps.push.models import CampaignPush
+from apps.utils.admin import ReadOnlyAdmin, EstimatedCountPaginator
+from apps.utils.hyperloglog import HyperLogLog
+from apps.utils.url_encoder import UrlEncoder, EncoderError
+
+
+def create_campaign_user(campaign_id=1):
+    return CampaignUser.objects.create(
+        campaign_id=campaign_id, user_id=1, agent_id=1, sheba_number='IR800170000000346979480003'
+    )
 
 
 class CampaignAPITestCase(APITestCase):
@@ -143,6 +173,12 @@ class CampaignAPITestCase(APITestCase):
         self.assertEqual(report_campaign.status_code, status.HTTP_200_OK)
         # report should just return partial contents here we create only two partial of four content
         self.assertTrue(len(report_campaign.data) == 2)
+        self.assertNotIn('Last-Modified', report_campaign)
+        report_not_modified = self.client.get(
+            reverse('campaign-report', args=[response_campaign.data['id']]),
+            HTTP_IF_NONE_MATCH=report_campaign['ETag']
+        )
+        self.assertEqual(report_not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
 
     def test_send_file(self):
         data = {
@@ -169,3 +205,408 @@ class CampaignAPITestCase(APITestCase):
         TelegramAgent.objects.create(bot_token=bot_token, specific_mark="test")
         response = self.client.get(reverse('campaign-test', args=[1]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class HyperLogLogTestCase(SimpleTestCase):
+    def test_count(self):
+        for distinct in [0, 1, 100, 20000]:
+            sketch = HyperLogLog()
+            sketch.add(*[f'10.0.{i // 256}.{i % 256}' for i in range(distinct)] * 2)
+            self.assertAlmostEqual(sketch.count(), distinct, delta=distinct * 0.05)
+
+    def test_merge(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        first.add(*range(5000))
+        second.add(*range(2500, 7500))
+
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+        self.assertAlmostEqual(merged.count(), 7500, delta=7500 * 0.05)
+        self.assertEqual(first.count(), HyperLogLog.from_bytes(first.to_bytes()).count())
+
+
+class UrlEncoderTestCase(SimpleTestCase):
+    encoded = {
+        0: 'mmmmm', 1: '867nv', 12: 'jy7yj', 255: '76fkw', 1000: 'ndrsn', 123456: 'mcmg7',
+        16777215: '7cc69', 16777216: '7cc65', 1099511627781: 'nvfkdckzp'
+    }
+
+    def test_encode_decode(self):
+        encoder = UrlEncoder()
+        for id, encoded in self.encoded.items():
+            self.assertEqual(encoder.encode_id(id), encoded)
+            self.assertEqual(encoder.decode_id(encoded), id)
+
+        self.assertEqual(encoder.encode_many(list(self.encoded)), list(self.encoded.values()))
+        self.assertEqual(encoder.decode_many(self.encoded.values()).tolist(), list(self.encoded))
+
+        self.assertEqual(encoder.decode_many(['']).tolist(), [encoder.decode_id('')])
+        self.assertEqual(encoder.decode_many(['', 'mcmg7']).tolist(), [encoder.decode_id(''), 123456])
+
+    def test_invalid_character(self):
+        with self.assertRaises(EncoderError):
+            UrlEncoder().decode_many(['mmmm!'])
+        with self.assertRaises(EncoderError):
+            UrlEncoder().decode_id('mmmm!')
+
+    def test_negative_id(self):
+        self.assertEqual(UrlEncoder().encode_id(-1), 'mmmmq')
+        with self.assertRaises(EncoderError):
+            UrlEncoder().encode_many([1, -1])
+
+    def test_int64_overflow(self):
+        encoder = UrlEncoder()
+        self.assertEqual(encoder.decode_many(['zzzzzzzzzzzz']).tolist(), [encoder.decode_id('zzzzzzzzzzzz')])
+        self.assertGreater(encoder.decode_id('zzzzzzzzzzzzzzzz'), 2 ** 63)
+        with self.assertRaises(EncoderError):
+            encoder.decode_many(['zzzzzzzzzzzzzzzz'])
+
+
+class CampaignUserPriceTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def test_bulk_price_parity(self):
+        # channel 2 is a second publisher of campaign 1, so a user can have two priced channels
+        CampaignPublisher.objects.create(campaign_id=1, publisher_id=2, tariff=1000)
+
+        campaign_users = []
+        for channels, posts_views in [
+            ([1], [(1530, None), (999, None)]),
+            ([1], [(0, None), (None, None)]),
+            ([1], [(None, 2000)]),
+            ([2], [(1530, 1600)]),
+            ([1, 2], [(1000, None)]),
+            ([1], []),
+        ]:
+            campaign_user = create_campaign_user()
+            campaign_user.channels.add(*channels)
+            for views, last_banner_views in posts_views:
+                campaign_post = CampaignPost.objects.create(
+                    campaign_user=campaign_user, campaign_content_id=1, views=views
+                )
+                if last_banner_views is not None:
+                    log_post_views(campaign_post.id, last_banner_views)
+            campaign_users.append(campaign_user)
+
+        # disabled posts are not paid
+        disabled_post = campaign_users[0].campaignpost_set.first()
+        disabled_post.is_enable = False
+        disabled_post.save()
+
+        tariffs = get_campaign_users_tariffs([campaign_user.id for campaign_user in campaign_users])
+        for campaign_user in campaign_users:
+            self.assertEqual(tariffs[campaign_user.id], campaign_user.tariff)
+
+        prices = get_campaign_users_prices([campaign_user.id for campaign_user in campaign_users])
+        self.assertTrue(any(prices.values()))
+        for campaign_user in campaign_users:
+            self.assertEqual(prices[campaign_user.id], campaign_user.calculate_price())
+
+        campaign_posts = CampaignPost.objects.filter(campaign_user__in=campaign_users)
+        prices = get_campaign_posts_prices([campaign_post.id for campaign_post in campaign_posts])
+        for campaign_post in campaign_posts:
+            self.assertEqual(prices[campaign_post.id], campaign_post.calculate_price())
+
+
+class ContentViewsRollupTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def setUp(self):
+        cache.clear()
+        self.campaign_user = create_campaign_user()
+
+    def assertRollup(self, posts_count, max_views, sum_views):
+        rollup = CampaignContentViews.objects.get(campaign_content_id=1)
+        self.assertEqual((rollup.posts_count, rollup.max_views, rollup.sum_views), (posts_count, max_views, sum_views))
+
+    def test_post_changes_update_rollup(self):
+        first = CampaignPost.objects.create(campaign_user=self.campaign_user, campaign_content_id=1, views=100)
+        self.assertRollup(1, 100, 100)
+        second = CampaignPost.objects.create(campaign_user=self.campaign_user, campaign_content_id=1, views=300)
+        self.assertRollup(2, 300, 400)
+
+        first.views = 150
+        first.save()
+        self.assertRollup(2, 300, 450)
+
+        second.is_enable = False
+        second.save()
+        self.assertRollup(1, 150, 150)
+
+        second.delete()
+        self.assertRollup(1, 150, 150)
+
+    def test_post_save_keeps_last_banner_views(self):
+        campaign_post = CampaignPost.objects.create(campaign_user=self.campaign_user, campaign_content_id=1)
+        log_post_views(campaign_post.id, 500)
+        self.assertRollup(1, 500, 500)
+
+        campaign_post.is_enable = True
+        campaign_post.save()
+        self.assertEqual(CampaignPostViews.objects.get(campaign_post=campaign_post).last_banner_views, 500)
+        self.assertRollup(1, 500, 500)
+
+        campaign_post.views = 400
+        campaign_post.save()
+        log_post_views(campaign_post.id, 600)
+        view_rollup = CampaignPostViews.objects.get(campaign_post=campaign_post)
+        self.assertEqual((view_rollup.views, view_rollup.last_banner_views), (400, 600))
+        self.assertRollup(1, 400, 400)
+
+
+class ViewCountersTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def test_missed_counter_is_seeded_from_rollup(self):
+        cache.clear()
+        # rollup already has the 100 new views recorded below
+        CampaignContentViews.objects.update_or_create(campaign_content_id=1, defaults={'sum_views': 900})
+        content = {
+            'id': 1, 'campaign_id': 1, 'view_type': CampaignContent.TYPE_VIEW_PARTIAL, 'campaign__max_view': 10 ** 6
+        }
+
+        record_views(content, 100)
+        self.assertEqual(cache.get(_content_key(1)), 900)
+        record_views(content, 50)
+        self.assertEqual(cache.get(_content_key(1)), 950)
+
+
+class ChangeListQueriesTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def add_rows(self, count):
+        for _ in range(count):
+            campaign = Campaign.objects.create(
+                title='campaign', max_view=1000, status=Campaign.STATUS_APPROVED,
+                start_datetime=timezone.now(), end_datetime=timezone.now()
+            )
+            campaign_user = create_campaign_user(campaign.id)
+            campaign_user.channels.add(1, 2)
+            CampaignPublisher.objects.create(campaign=campaign, publisher_id=1, tariff=3500)
+            CampaignPublisher.objects.create(campaign=campaign, publisher_id=2, tariff=1000)
+            CampaignPost.objects.create(campaign_user=campaign_user, campaign_content_id=1, views=1000)
+            CampaignPush.objects.create(campaign=campaign).publishers.add(1)
+
+    def changelist(self, model):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(id=10)
+        return admin.site._registry[model].get_changelist_instance(request)
+
+    def changelist_queries(self, model):
+        """
+            number of queries to build changelist page and all of it's columns
+        """
+        model_admin = admin.site._registry[model]
+        with CaptureQueriesContext(connection) as context:
+            changelist = self.changelist(model)
+            for obj in changelist.result_list:
+                for field_name in changelist.list_display:
+                    if field_name != 'action_checkbox':
+                        lookup_field(field_name, obj, model_admin)
+        return len(context)
+
+    def test_queries_count_is_fixed(self):
+        models = [Campaign, CampaignUser, CampaignPost, CampaignPush]
+        self.add_rows(2)
+        queries = [self.changelist_queries(model) for model in models]
+        self.add_rows(10)
+        self.assertEqual(queries, [self.changelist_queries(model) for model in models])
+
+    def test_campaign_user_channel_and_price(self):
+        self.add_rows(1)
+        model_admin = admin.site._registry[CampaignUser]
+        campaign_user = self.changelist(CampaignUser).result_list[0]
+        tags = TelegramChannel.objects.filter(id__in=[1, 2]).order_by('id').values_list('tag', flat=True)
+        self.assertEqual(sorted(model_admin.channel(campaign_user).split(', ')), sorted(tags))
+        self.assertEqual(model_admin.calculated_price(campaign_user), campaign_user.calculate_price())
+        self.assertEqual(model_admin.channels_tariff(campaign_user), campaign_user.tariff)
+
+    def test_campaign_post_price(self):
+        self.add_rows(1)
+        model_admin = admin.site._registry[CampaignPost]
+        campaign_post = self.changelist(CampaignPost).result_list[0]
+        self.assertEqual(model_admin.price(campaign_post), f"{campaign_post.calculate_price():,}")
+
+    def test_push_confirmed_channels(self):
+        self.add_rows(1)
+        model_admin = admin.site._registry[CampaignPush]
+        push = self.changelist(CampaignPush).result_list[0]
+        # campaign user has channels 1 and 2, only channel 1 publishes the push
+        self.assertEqual(model_admin.confirmed_channels(push), TelegramChannel.objects.get(id=1).tag)
+        self.assertEqual(
+            model_admin.confirmed_channels(push),
+            ", ".join(push.confirmed_channels().values_list('channels__tag', flat=True))
+        )
+
+
+class ReportSnapshotTestCase(TestCase):
+    fixtures = ['campaign']
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('apps.telegram_adv.reports.schedule_report_snapshot')
+        self.schedule_report_snapshot = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stale_snapshot_is_served_and_rendered_in_background(self):
+        snapshot = render_report_snapshot(1)
+        self.assertFalse(is_snapshot_stale(snapshot))
+        self.assertEqual(get_report_snapshot(1), snapshot.data)
+        self.schedule_report_snapshot.assert_not_called()
+
+        CampaignReportSnapshot.objects.filter(campaign_id=1).update(data={'stale': True})
+        invalidate_campaign_report(1)
+        self.schedule_report_snapshot.reset_mock()
+        self.assertTrue(is_snapshot_stale(CampaignReportSnapshot.objects.get(campaign_id=1)))
+        self.assertEqual(get_report_snapshot(1), {'stale': True})
+        self.schedule_report_snapshot.assert_called_once_with(1)
+
+    def test_evicted_version_keeps_snapshot_stale(self):
+        snapshot = render_report_snapshot(1)
+        invalidate_campaign_report(1)
+        cache.delete(_report_version_key(1))
+        self.assertTrue(is_snapshot_stale(snapshot))
+
+    def test_first_snapshot_is_rendered_once(self):
+        cache.add(_snapshot_lock_key(1), 1)
+        self.assertIsNone(get_report_snapshot(1))
+        self.assertFalse(CampaignReportSnapshot.objects.filter(campaign_id=1).exists())
+
+        cache.delete(_snapshot_lock_key(1))
+        data = get_report_snapshot(1)
+        self.assertEqual(CampaignReportSnapshot.objects.get(campaign_id=1).data, data)
+
+    def test_advertiser_report_view(self):
+        url = reverse('advertiser-report', args=[Campaign.objects.get(id=1).url_encode()])
+
+        cache.add(_snapshot_lock_key(1), 1)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '1')
+
+        cache.delete(_snapshot_lock_key(1))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), CampaignReportSnapshot.objects.get(campaign_id=1).data)
+
+        self.assertEqual(self.client.get(reverse('advertiser-report', args=['mmmm!'])).status_code, 404)
+        missing = Campaign(id=Campaign.objects.order_by('-id').first().id + 1)
+        self.assertEqual(self.client.get(reverse('advertiser-report', args=[missing.url_encode()])).status_code, 404)
+
+
+class UserKeysetAdmin(ReadOnlyAdmin):
+    keyset_pagination = True
+    keyset_date_field = 'date_joined'
+    list_display = ['username']
+    list_per_page = 2
+
+
+class KeysetChangeListTestCase(TestCase):
+    def setUp(self):
+        # one user per day, pk and date_joined grow together
+        start = timezone.datetime(2020, 1, 1)
+        self.users = [
+            User.objects.create(username=f'user{day}', date_joined=start + timezone.timedelta(days=day))
+            for day in range(5)
+        ]
+        self.pks = [user.pk for user in self.users]
+
+    def changelist(self, keyset_field='id', **params):
+        model_admin = UserKeysetAdmin(User, admin.AdminSite())
+        model_admin.keyset_field = keyset_field
+        request = RequestFactory().get('/', params)
+        request.user = User(is_superuser=True)
+        return model_admin.get_changelist_instance(request)
+
+    def result_pks(self, changelist):
+        return [user.pk for user in changelist.result_list]
+
+    def test_seek(self):
+        for keyset_field in ('id', 'date_joined'):
+            changelist = self.changelist(keyset_field)
+            self.assertEqual(self.result_pks(changelist), self.pks[:-3:-1])
+            self.assertFalse(changelist.has_newer)
+
+            changelist = self.changelist(keyset_field, after=self.pks[3])
+            self.assertEqual(self.result_pks(changelist), [self.pks[2], self.pks[1]])
+            self.assertTrue(changelist.has_newer)
+            self.assertTrue(changelist.has_older)
+
+            changelist = self.changelist(keyset_field, after=self.pks[1])
+            self.assertEqual(self.result_pks(changelist), [self.pks[0]])
+            self.assertFalse(changelist.has_older)
+
+    def test_before_fills_page(self):
+        changelist = self.changelist(before=self.pks[1])
+        self.assertEqual(self.result_pks(changelist), [self.pks[3], self.pks[2]])
+        self.assertTrue(changelist.has_newer)
+
+        # newer rows don't fill a page, first page is shown
+        changelist = self.changelist(before=self.pks[3])
+        self.assertEqual(self.result_pks(changelist), [self.pks[4], self.pks[3]])
+        self.assertFalse(changelist.has_newer)
+
+    def test_deleted_anchor_and_invalid_params(self):
+        self.users[2].delete()
+        changelist = self.changelist('date_joined', after=self.pks[2])
+        self.assertEqual(self.result_pks(changelist), [self.pks[4], self.pks[3]])
+        self.assertFalse(changelist.has_newer)
+
+        for params in ({'after': 'x'}, {'before': '1.5'}, {'date': '2020-13-45'}):
+            with self.assertRaises(IncorrectLookupParameters):
+                self.changelist(**params)
+
+    def test_pk_at_date(self):
+        changelist = self.changelist()
+        self.assertEqual(changelist._pk_at_date(timezone.datetime(2020, 1, 3).date()), self.pks[3])
+        self.assertEqual(changelist._pk_at_date(timezone.datetime(2019, 12, 1).date()), self.pks[0])
+        self.assertEqual(changelist._pk_at_date(timezone.datetime(2020, 2, 1).date()), self.pks[-1] + 1)
+
+        changelist = self.changelist(date='2020-01-03')
+        self.assertEqual(self.result_pks(changelist), [self.pks[2], self.pks[1]])
+        self.assertTrue(changelist.has_newer)
+
+
+class EstimatedCountPaginatorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(3):
+            User.objects.create(username=f'user{index}')
+        self.users = User.objects.order_by('id')
+
+    def fake_connection(self, vendor='postgresql', row=None, execute=None):
+        fake_connection = mock.MagicMock(vendor=vendor)
+        cursor = fake_connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = row
+        cursor.execute.side_effect = execute
+        patcher = mock.patch('apps.utils.admin.connections', {'default': fake_connection})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return cursor
+
+    def test_plain_count_and_cache(self):
+        self.fake_connection(vendor='sqlite')
+        self.assertEqual(EstimatedCountPaginator(self.users, 2).count, 3)
+
+        # counts are cached by query
+        User.objects.create(username='user3')
+        self.assertEqual(EstimatedCountPaginator(self.users, 2).count, 3)
+        self.assertEqual(EstimatedCountPaginator(self.users.filter(username='user3'), 2).count, 1)
+
+    def test_table_estimate(self):
+        cursor = self.fake_connection(row=(1000000,))
+        self.assertEqual(EstimatedCountPaginator(self.users, 2).count, 1000000)
+        self.assertIn('pg_class', cursor.execute.call_args[0][0])
+
+    def test_filtered_exact_count(self):
+        cursor = self.fake_connection()
+        self.assertEqual(EstimatedCountPaginator(self.users.filter(username='user1'), 2).count, 1)
+        self.assertEqual(cursor.execute.call_args_list[0][0][0], "SET LOCAL statement_timeout = 1000")
+
+    def test_timeout_falls_back_to_planner_estimate(self):
+        def execute(sql, params=None):
+            if sql.startswith('SET LOCAL'):
+                raise OperationalError('canceling statement due to statement timeout')
+
+        cursor = self.fake_connection(row=([{'Plan': {'Plan Rows': 42}}],), execute=execute)
+        self.assertEqual(EstimatedCountPaginator(self.users.filter(username='user1'), 2).count, 42)
+        self.assertTrue(cursor.execute.call_args[0][0].startswith('EXPLAIN (FORMAT JSON)'))
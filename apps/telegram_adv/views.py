@@ -0,0 +1,52 @@
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+
+from apps.utils.url_encoder import EncoderError
+
+from .models import Campaign
+from .link_resolver import resolve_short_link
+from .hit_buffer import record_hit
+from .reports import get_report_snapshot
+
+
+def _client_ip(request):
+    # first X-Forwarded-For entries are set by the client, only the address added by our proxy is trusted
+    real_ip = request.META.get('HTTP_X_REAL_IP')
+    if real_ip:
+        return real_ip.strip()
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def short_link_redirect(request, code):
+    """
+        redirect short link to it's campaign link, no database query on the hot path:
+        url is resolved from caches and the click is counted in hit buffer
+    """
+    short_link_id, url = resolve_short_link(code)
+    if url is None:
+        raise Http404
+
+    record_hit(short_link_id, _client_ip(request))
+    return HttpResponseRedirect(url)
+
+
+def advertiser_report(request, encoded):
+    """
+        campaign report shared with advertiser (Campaign.report_link), served from report snapshot
+    """
+    try:
+        campaign_id = Campaign.url_decode(encoded)
+    except EncoderError:
+        raise Http404
+
+    if not Campaign.objects.filter(id=campaign_id).exists():
+        raise Http404
+
+    data = get_report_snapshot(campaign_id)
+    if data is None:  # first snapshot is being rendered
+        response = JsonResponse({}, status=202)
+        response['Retry-After'] = 1
+        return response
+    return JsonResponse(data)
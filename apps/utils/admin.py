@@ -1,13 +1,307 @@
+import json
+import hashlib
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured, ValidationError
+from django.db import connections, transaction, OperationalError
+from django.db.models import Q, Max, Min
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
 
 from django_admin_listfilter_dropdown.filters import RelatedDropdownFilter
 
 from apps.telegram_adv.models import Campaign
 
 
+class AnnotatedChangeList(ChangeList):
+    """
+        changelist which applies model admin list_annotations and list_prefetch_related to it's queryset
+        and gives current page objects to model admin load_page
+    """
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.model_admin.list_annotations:
+            queryset = queryset.annotate(**self.model_admin.list_annotations)
+        if self.model_admin.list_prefetch_related:
+            queryset = queryset.prefetch_related(*self.model_admin.list_prefetch_related)
+        return queryset
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = list(self.result_list)
+        if self.result_list:
+            self.model_admin.load_page(request, self.result_list)
+
+
+class AnnotatedChangeListMixin(object):
+    """
+        computed changelist columns without per row queries, page renders with a fixed number of queries
+
+            * list_annotations: dict of name and expression annotated to changelist queryset
+            * list_prefetch_related: lookups prefetched for changelist rows only
+            * load_page: batch load columns of page objects (one query per column) and set them on objects
+
+        not supported with ReadOnlyAdmin keyset_pagination
+    """
+    list_annotations = {}
+    list_prefetch_related = ()
+
+    def get_changelist(self, request, **kwargs):
+        if getattr(self, 'keyset_pagination', False):
+            raise ImproperlyConfigured(
+                f"{self.__class__.__name__}: AnnotatedChangeListMixin can not be used with keyset_pagination"
+            )
+        return AnnotatedChangeList
+
+    def load_page(self, request, objects):
+        pass
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+        paginator of large tables which don't afford COUNT(*) on every changelist page
+
+            * not filtered queryset: table rows estimate of postgres statistics (pg_class.reltuples)
+            * filtered queryset: exact count limited to count_timeout milliseconds,
+              planner rows estimate when it times out
+            * counts are cached cache_timeout seconds
+
+        use with `show_full_result_count = False` to skip changelist full table count
+    """
+    count_timeout = 1000
+    cache_timeout = 60
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        key = 'admin_count_' + hashlib.md5(f'{sql} {params}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self._count(queryset)
+            cache.set(key, count, self.cache_timeout)
+        return count
+
+    def _count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # never analyzed tables has no estimate
+            if row and row[0] > 0:
+                return row[0]
+
+        try:
+            with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(self.count_timeout)}")
+                count = queryset.count()
+                # request may be in a transaction (ATOMIC_REQUESTS), don't leave timeout for next queries
+                cursor.execute("SET LOCAL statement_timeout TO DEFAULT")
+                return count
+        except OperationalError:  # statement timeout
+            return self._planner_estimate(queryset)
+
+    @staticmethod
+    def _planner_estimate(queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetChangeList(ChangeList):
+    """
+        changelist paged by seek on model admin keyset_field (and pk as tie breaker) instead of OFFSET,
+        every page costs the same whatever its depth
+
+            * after / before: pk of last / first row of current page, next / previous page,
+              first page is shown when row of a keyset_field (not pk) page is deleted
+            * date: jump to rows created on or before this date (YYYY-MM-DD), date of pk keyset is read
+              from model admin keyset_date_field
+    """
+    AFTER_VAR = 'after'
+    BEFORE_VAR = 'before'
+    DATE_VAR = 'date'
+    KEYSET_VARS = (AFTER_VAR, BEFORE_VAR, DATE_VAR)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in self.KEYSET_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    @property
+    def keyset_field(self):
+        return self.model_admin.keyset_field
+
+    def _is_pk_field(self):
+        return self.keyset_field in ('pk', 'id', self.model._meta.pk.name)
+
+    def get_ordering(self, request, queryset):
+        if self._is_pk_field():
+            return ['-pk']
+        return [f'-{self.keyset_field}', '-pk']
+
+    def _keyset_param(self, var):
+        value = self.params.get(var)
+        if not value:
+            return None
+        try:
+            return self.model._meta.pk.to_python(value)
+        except ValidationError as e:
+            raise IncorrectLookupParameters(e)
+
+    def _date_param(self):
+        value = self.params.get(self.DATE_VAR)
+        if not value:
+            return None
+        try:
+            date = parse_date(value)
+        except ValueError as e:
+            raise IncorrectLookupParameters(e)
+        if date is None:
+            raise IncorrectLookupParameters(f"invalid date: {value}")
+        return date
+
+    def _seek(self, queryset, pk, newer):
+        """
+        :return: rows newer or older than pk row, None if keyset value of pk row is not found
+        """
+        lookup = 'gt' if newer else 'lt'
+        if self._is_pk_field():
+            return queryset.filter(**{f'pk__{lookup}': pk})
+
+        value = self.model._default_manager.filter(pk=pk).values_list(self.keyset_field, flat=True).first()
+        if value is None:
+            return None
+        return queryset.filter(
+            Q(**{f'{self.keyset_field}__{lookup}': value}) |
+            Q(**{self.keyset_field: value, f'pk__{lookup}': pk})
+        )
+
+    @staticmethod
+    def _date_end(date):
+        end_time = timezone.datetime.combine(date, timezone.datetime.min.time()) + timezone.timedelta(days=1)
+        if settings.USE_TZ:
+            end_time = timezone.make_aware(end_time)
+        return end_time
+
+    def _pk_at_date(self, date):
+        """
+            first pk created after date end, binary search by pk lookups so date field needs no index,
+            pk and created time of append only tables grow together
+        """
+        manager = self.model._default_manager
+        end_time = self._date_end(date)
+        bounds = manager.aggregate(low=Min('pk'), high=Max('pk'))
+        low, high = bounds['low'], bounds['high']
+        if low is None:
+            return None
+
+        high += 1
+        while low < high:
+            middle = (low + high) // 2
+            row = manager.filter(
+                pk__gte=middle
+            ).order_by(
+                'pk'
+            ).values_list(
+                'pk', self.model_admin.keyset_date_field
+            ).first()
+            if row is None or row[1] >= end_time:
+                high = middle
+            else:
+                low = row[0] + 1
+        return low
+
+    def get_results(self, request):
+        queryset = self.queryset
+        per_page = self.list_per_page
+        after, before = self._keyset_param(self.AFTER_VAR), self._keyset_param(self.BEFORE_VAR)
+        date = self._date_param()
+
+        rows = None
+        newer_queryset = self._seek(queryset, before, newer=True) if before is not None else None
+        if newer_queryset is not None:
+            newer_rows = list(newer_queryset.reverse()[:per_page + 1])[::-1]
+            # newer rows which don't fill a page are shown as first page
+            if len(newer_rows) > per_page:
+                rows, self.has_newer, self.has_older = newer_rows[-per_page:], True, True
+
+        if rows is None:
+            older_queryset = None
+            if after is not None and before is None:
+                older_queryset = self._seek(queryset, after, newer=False)
+            elif date and self._is_pk_field():
+                pk = self._pk_at_date(date)
+                if pk is not None:
+                    older_queryset = queryset.filter(pk__lt=pk)
+            elif date:
+                older_queryset = queryset.filter(**{f'{self.keyset_field}__lt': self._date_end(date)})
+
+            if older_queryset is not None:
+                queryset = older_queryset
+            rows = list(queryset[:per_page + 1])
+            self.has_newer = older_queryset is not None
+            self.has_older = len(rows) > per_page
+            rows = rows[:per_page]
+
+        self.result_list = rows
+        self.result_count = len(rows)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_all = False
+        self.can_show_all = False
+        self.multi_page = self.has_newer or self.has_older
+        self.paginator = Paginator(rows, per_page)
+
+        self.newer_url = self.get_query_string(
+            {self.BEFORE_VAR: rows[0].pk}, [self.AFTER_VAR, self.DATE_VAR]
+        ) if rows and self.has_newer else None
+        self.older_url = self.get_query_string(
+            {self.AFTER_VAR: rows[-1].pk}, [self.BEFORE_VAR, self.DATE_VAR]
+        ) if rows and self.has_older else None
+        self.first_url = self.get_query_string(remove=list(self.KEYSET_VARS))
+
+
 class ReadOnlyAdmin(admin.ModelAdmin):
     super_user_can = False
+    # seek pagination on keyset_field for large append only tables, see KeysetChangeList
+    keyset_pagination = False
+    keyset_field = 'id'
+    keyset_date_field = 'created_time'
+
+    def get_changelist(self, request, **kwargs):
+        if self.keyset_pagination:
+            return KeysetChangeList
+        return super().get_changelist(request, **kwargs)
+
+    @property
+    def change_list_template(self):
+        if self.keyset_pagination:
+            return 'admin/keyset_change_list.html'
+        return None
 
     def _super_user_can(self, request):
         return request.user.is_superuser and self.super_user_can
@@ -0,0 +1,33 @@
+import time
+
+from django.core.cache import cache
+
+
+def _seed_version():
+    # microseconds, a version evicted and seeded again never lands on a version incremented before eviction
+    return time.time_ns() // 1000
+
+
+def get_cache_version(version_key):
+    """
+        current version of a group of cached entries, entries are keyed with it
+        a missing version is seeded time based so entries cached under an evicted version are never read again
+    """
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, _seed_version(), None)
+        version = cache.get(version_key)
+        if version is None:  # cache is down, nothing cached can match
+            version = _seed_version()
+    return version
+
+
+def bump_cache_version(version_key):
+    """
+        invalidate all entries cached under current version of `version_key`
+    """
+    cache.add(version_key, _seed_version(), None)
+    try:
+        cache.incr(version_key)
+    except ValueError:  # evicted between add and incr
+        cache.set(version_key, _seed_version(), None)
@@ -0,0 +1,82 @@
+import hashlib
+
+import numpy as np
+
+HLL_PRECISION = 12
+
+
+def hash_value(value):
+    """
+        64 bit hash of a string value (ip address, ...) to add in HyperLogLog
+
+    :param value:
+    :return: int
+    """
+    return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+
+class HyperLogLog(object):
+    """
+        HyperLogLog distinct counter with 2 ** precision uint8 registers (4KB for default precision),
+        sketches of same precision merge by registers maximum so buckets can be combined in any range.
+        standard error is about 1.04 / sqrt(2 ** precision), 1.6% for default precision
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = np.zeros(self.size, dtype=np.uint8)
+        self.registers = registers
+
+    @classmethod
+    def from_bytes(cls, data, precision=HLL_PRECISION):
+        """
+        :param data: bytes of to_bytes(), empty or None makes an empty sketch
+        :param precision:
+        :return: HyperLogLog
+        """
+        if not data:
+            return cls(precision)
+        return cls(precision, np.frombuffer(bytes(data), dtype=np.uint8).copy())
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    def add_hashes(self, hashes):
+        """
+        :param hashes: iterable of 64 bit hashes, see hash_value()
+        :return:
+        """
+        hashes = np.fromiter(hashes, dtype=np.uint64)
+        if not hashes.size:
+            return
+
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest_bits = 64 - self.precision
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # rank is position of first set bit of the rest bits, rest_bits + 1 when all are zero
+        bit_length = np.zeros(hashes.size, dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (rest_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, *values):
+        self.add_hashes(hash_value(value) for value in values)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.size and zeros:
+            # small range correction, linear counting
+            estimate = self.size * np.log(self.size / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
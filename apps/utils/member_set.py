@@ -0,0 +1,34 @@
+from django.core.cache import cache
+
+
+class CacheMemberSet(object):
+    """
+        set stored in cache backend with one key per member,
+        add and membership test cost depends on given members not whole set size
+    """
+
+    def __init__(self, name, timeout=None, backend=cache):
+        self.name = name
+        self.timeout = timeout
+        self.cache = backend
+
+    def _key(self, member):
+        return f'{self.name}_{member}'
+
+    def add_many(self, members):
+        self.cache.set_many({self._key(member): 1 for member in members}, self.timeout)
+
+    def add(self, member):
+        self.add_many([member])
+
+    def contains_many(self, members):
+        """
+        :param members:
+        :return: set of given members which are in the set
+        """
+        keys = {self._key(member): member for member in members}
+        return {keys[key] for key in self.cache.get_many(list(keys))}
+
+    def __contains__(self, member):
+        return bool(self.contains_many([member]))
+
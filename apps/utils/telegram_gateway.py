@@ -0,0 +1,138 @@
+import time
+import logging
+import hashlib
+import threading
+import functools
+
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.utils.request import Request
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRateLimiter(object):
+    """
+        telegram rate limiter shared by all processes through cache backend
+
+            * global: one second window counter per bot token, at most `rate` calls per window
+            * per chat: cache.add lock per chat which lives `chat_interval` seconds
+            * retry after: when telegram answer 429 all processes wait until `retry_after` passed
+    """
+
+    def __init__(self, name, rate, chat_interval, backend=cache):
+        self.name = name
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.cache = backend
+
+    def _key(self, *parts):
+        return '_'.join(['tg_rate', self.name] + [str(part) for part in parts])
+
+    def block(self, seconds):
+        self.cache.set(self._key('retry_after'), time.time() + seconds, int(seconds) + 1)
+
+    def _wait_time(self, chat_id):
+        now = time.time()
+        blocked_until = self.cache.get(self._key('retry_after'), 0)
+        if blocked_until > now:
+            return blocked_until - now
+
+        if chat_id is not None and not self.cache.add(
+                self._key('chat', chat_id), 1, max(1, int(round(self.chat_interval)))
+        ):
+            return self.chat_interval / 4
+
+        window = int(now)
+        window_key = self._key('window', window)
+        self.cache.add(window_key, 0, 2)
+        try:
+            count = self.cache.incr(window_key)
+        except ValueError:  # window key expired between add and incr
+            return 0.01
+
+        if count > self.rate:
+            if chat_id is not None:
+                self.cache.delete(self._key('chat', chat_id))
+            return window + 1 - now
+
+        return 0
+
+    def acquire(self, chat_id=None):
+        while True:
+            wait = self._wait_time(chat_id)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class BotGateway(object):
+    """
+        outbound gateway for telegram Bot API calls, proxies telegram.Bot methods
+
+            * one Bot and connection pool per token in each process
+            * calls wait for shared rate limiter, chat_id is read from `chat_id` kwarg or first arg
+            * RetryAfter (429) blocks the token for all processes then the call is retried
+    """
+
+    def __init__(self, token, retries=3):
+        self.token = token
+        self.name = hashlib.md5(token.encode()).hexdigest()[:12]
+        self.retries = retries
+        self.bot = Bot(
+            token=token,
+            base_url=settings.TELEGRAM_BOT['API_URL'],
+            request=Request(
+                con_pool_size=settings.TELEGRAM_CON_POOL_SIZE,
+                connect_timeout=3.05,
+                read_timeout=27,
+                proxy_url=settings.TELEGRAM_BOT['PROXY'] or None
+            )
+        )
+        self.limiter = SharedRateLimiter(
+            self.name,
+            settings.TELEGRAM_GLOBAL_RATE,
+            settings.TELEGRAM_CHAT_INTERVAL
+        )
+
+    def call(self, method, *args, **kwargs):
+        chat_id = kwargs.get('chat_id', args[0] if args else None)
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(chat_id)
+            try:
+                return getattr(self.bot, method)(*args, **kwargs)
+            except RetryAfter as e:
+                logger.warning(f"telegram {method} throttled, retry after: {e.retry_after} attempt: {attempt}")
+                self.limiter.block(e.retry_after)
+                if attempt == self.retries:
+                    raise
+
+    def __getattr__(self, name):
+        attr = getattr(self.bot, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self.call, name)
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(token=None):
+    """
+        return process wide BotGateway of token, default is settings.TELEGRAM_BOT['TOKEN']
+
+    :param token:
+    :return:
+    """
+    token = token or settings.TELEGRAM_BOT['TOKEN']
+    gateway = _gateways.get(token)
+    if gateway is None:
+        with _gateways_lock:
+            if token not in _gateways:
+                _gateways[token] = BotGateway(token)
+            gateway = _gateways[token]
+    return gateway
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class EncoderError(Exception):
     """
     Exception for errors that occur while encoding/decoding
@@ -56,6 +59,38 @@ class UrlEncoder(object):
     mask = (1 << block_size) - 1
     mapping = list(reversed(range(block_size)))
 
+    def __init__(self):
+        # bits shuffle is done one byte at a time with precomputed tables of every byte position
+        self._bytes_count = -(-self.block_size // 8)
+        self._encode_tables = self._build_tables(lambda i, b: (i, b))
+        self._decode_tables = self._build_tables(lambda i, b: (b, i))
+        self._char_values = {c: i for i, c in enumerate(self.alphabet)}
+        self._char_table = np.full(max(map(ord, self.alphabet)) + 1, -1, dtype=np.int64)
+        self._char_table[[ord(c) for c in self.alphabet]] = np.arange(len(self.alphabet))
+        # digits of values which always fit int64
+        self._int64_digits = len(self._enbase(np.iinfo(np.int64).max)) - 1
+
+    def _build_tables(self, direction):
+        """
+            tables[k][byte] is shuffled bits of `byte` at k-th byte position of input
+        """
+        tables = [[0] * 256 for _ in range(self._bytes_count)]
+        for i, b in enumerate(self.mapping):
+            source, target = direction(i, b)
+            table = tables[source // 8]
+            for byte in range(256):
+                if byte & (1 << (source % 8)):
+                    table[byte] |= (1 << target)
+        return tables
+
+    @staticmethod
+    def _shuffle(tables, n):
+        result = 0
+        for table in tables:
+            result |= table[n & 0xff]
+            n >>= 8
+        return result
+
     def encode_id(self, id):
         """
         Encodes an integer.
@@ -69,11 +104,7 @@ class UrlEncoder(object):
         return (n & ~self.mask) | self._encode(n & self.mask)
 
     def _encode(self, n):
-        result = 0
-        for i, b in enumerate(self.mapping):
-            if n & (1 << i):
-                result |= (1 << b)
-        return result
+        return self._shuffle(self._encode_tables, n)
 
     def enbase(self, x):
         result = self._enbase(x)
@@ -81,10 +112,14 @@ class UrlEncoder(object):
         return '%s%s' % (padding, result)
 
     def _enbase(self, x):
+        # last digit is alphabet[x] like the recursive version, negative x is a single character
         n = len(self.alphabet)
-        if x < n:
-            return self.alphabet[x]
-        return self._enbase(x // n) + self.alphabet[x % n]
+        chars = []
+        while x >= n:
+            x, digit = divmod(x, n)
+            chars.append(self.alphabet[digit])
+        chars.append(self.alphabet[x])
+        return ''.join(reversed(chars))
 
     def decode_id(self, encoded):
         """
@@ -99,19 +134,83 @@ class UrlEncoder(object):
         return (n & ~self.mask) | self._decode(n & self.mask)
 
     def _decode(self, n):
-        result = 0
-        for i, b in enumerate(self.mapping):
-            if n & (1 << b):
-                result |= (1 << i)
-        return result
+        return self._shuffle(self._decode_tables, n)
 
     def debase(self, x):
         n = len(self.alphabet)
         result = 0
-        for i, c in enumerate(reversed(x)):
+        for c in x:
             try:
-                result += self.alphabet.index(c) * (n ** i)
-            except ValueError:
+                result = result * n + self._char_values[c]
+            except KeyError:
                 raise EncoderError("Encoded value characters don't match the "
                                    "defined alphabet.")
-        return result
\ No newline at end of file
+        return result
+
+    def _shuffle_many(self, tables, values):
+        low = values & np.int64(self.mask)
+        result = values & np.int64(~self.mask)
+        for k, table in enumerate(tables):
+            result |= np.asarray(table, dtype=np.int64)[(low >> (8 * k)) & 0xff]
+        return result
+
+    def encode_many(self, ids):
+        """
+        Encodes an array of non negative integers, same as :func:`UrlEncoder.encode_id` for each id.
+        :param ids: array like of int64.
+        :returns: list of str -- the encoded values.
+        :raises: EncoderError -- an id is negative.
+        """
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        if (ids < 0).any():
+            raise EncoderError("Negative ids can't be encoded.")
+
+        values = self._shuffle_many(self._encode_tables, ids)
+        if not values.size:
+            return []
+
+        n = len(self.alphabet)
+        length = max(self.min_length, len(self._enbase(int(values.max()))))
+        digits = np.empty((values.size, length), dtype=np.int64)
+        for column in range(length - 1, -1, -1):
+            values, digits[:, column] = np.divmod(values, n)
+
+        # leading zero digits are alphabet[0], the padding character, so only
+        # characters before min_length or the first non zero digit are dropped
+        significant = np.where(digits.any(axis=1), np.argmax(digits != 0, axis=1), length - 1)
+        starts = np.minimum(significant, length - self.min_length)
+        rows = np.asarray(list(self.alphabet))[digits].view(f'<U{length}').ravel()
+        return [row[start:] for row, start in zip(rows.tolist(), starts.tolist())]
+
+    def decode_many(self, encoded):
+        """
+        Decodes a sequence of values encoded with :func:`UrlEncoder.encode_id` or :func:`UrlEncoder.encode_many`.
+        :param encoded: sequence of str.
+        :returns: numpy array of int64 -- the decoded values.
+        :raises: EncoderError -- a value has characters out of alphabet or is too large for int64.
+        """
+        encoded = list(encoded)
+        if not encoded:
+            return np.asarray([], dtype=np.int64)
+
+        # empty values are padded to one zero digit like debase('') == 0
+        length = max(1, max(len(x) for x in encoded))
+        padded = np.asarray([x.rjust(length, self.alphabet[0]) for x in encoded], dtype=f'<U{length}')
+        codes = padded.view(np.uint32).reshape(len(encoded), length)
+
+        table_size = self._char_table.size
+        digits = np.where(codes < table_size, self._char_table[np.minimum(codes, table_size - 1)], -1)
+        if (digits < 0).any():
+            raise EncoderError("Encoded value characters don't match the "
+                               "defined alphabet.")
+
+        limit = np.iinfo(np.int64).max
+        for x in encoded:
+            if len(x.lstrip(self.alphabet[0])) > self._int64_digits and self.debase(x) > limit:
+                raise EncoderError("Encoded value is too large for int64.")
+
+        n = len(self.alphabet)
+        values = np.zeros(len(encoded), dtype=np.int64)
+        for column in range(length):
+            values = values * n + digits[:, column]
+        return self._shuffle_many(self._decode_tables, values)